@@ -30,6 +30,7 @@ const initialState = {
     isLoading: false,
     resultsFiltered: false,
     totalItems: null,
+    nextPage: null,
     activeQuery: null,
     user: null,
     company: null,
@@ -116,6 +117,7 @@ function recieveItems(state, data) {
         itemsById,
         isLoading: false,
         totalItems: data._meta.total,
+        nextPage: data._next || null,
         aggregations: processAggregations(data._aggregations) || null,
         newItems: [],
         agenda,
@@ -158,7 +158,7 @@ export function defaultReducer(state, action) {
             }
             return item._id;
         });
-        return {...state, items: uniq([...state.items, ...newItems]), itemsById, isLoading: false};
+        return {...state, items: uniq([...state.items, ...newItems]), itemsById, isLoading: false, nextPage: action.data._next || null};
     }
 
     case SET_STATE:
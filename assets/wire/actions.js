@@ -187,7 +187,7 @@ function search(state, next) {
         bookmarks: state.bookmarks && state.user,
         navigation: activeNavigation,
         filter: !isEmpty(activeFilter) && encodeURIComponent(JSON.stringify(activeFilter)),
-        from: next ? state.items.length : 0,
+        after: next ? state.nextPage : null,
         created_from: createdFilter.from,
         created_to,
         timezone_offset: getTimezoneOffset(),
@@ -512,13 +512,11 @@ export function recieveNextItems(data) {
     return {type: RECIEVE_NEXT_ITEMS, data};
 }
 
-const MAX_ITEMS = 1000; // server limit
 export function fetchMoreItems() {
     return (dispatch, getState) => {
         const state = getState();
-        const limit = Math.min(MAX_ITEMS, state.totalItems);
 
-        if (state.isLoading || state.items.length >= limit) {
+        if (state.isLoading || !state.nextPage || state.items.length >= state.totalItems) {
             return Promise.reject();
         }
 
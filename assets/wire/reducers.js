@@ -18,6 +18,7 @@ const initialState = {
     openItem: null,
     isLoading: false,
     totalItems: null,
+    nextPage: null,
     activeQuery: null,
     user: null,
     company: null,
@@ -51,6 +52,7 @@ function recieveItems(state, data) {
         itemsById,
         isLoading: false,
         totalItems: data._meta.total,
+        nextPage: data._next || null,
         aggregations: data._aggregations || null,
         newItems: [],
         searchInitiated: false,
@@ -13,6 +13,7 @@ describe('wire actions', () => {
     const response = {
         _meta: {total: 2},
         _items: [{_id: 'foo'}],
+        _next: 'next-page',
     };
 
     beforeEach(() => {
@@ -138,7 +139,7 @@ describe('wire actions', () => {
     });
 
     it('can fetch more items', (done) => {
-        fetchMock.get('begin:/wire/search?from=1&tick=', {_items: [{_id: 'bar'}]});
+        fetchMock.get('begin:/wire/search?after=next-page&tick=', {_items: [{_id: 'bar'}]});
         return store.dispatch(actions.fetchItems())
             .then(() => {
                 expect(store.getState().totalItems).toBe(2);
@@ -7,6 +7,8 @@ from newsroom.elastic_utils import rebuild_elastic_index
 from newsroom.mongo_utils import index_elastic_from_mongo
 from newsroom.auth import get_user_by_email
 from newsroom.company_expiry_alerts import CompanyExpiryAlerts
+from newsroom.push import requeue_pushes
+from newsroom.topics.percolator import sync_topics
 
 
 app = Newsroom()
@@ -40,9 +42,14 @@ def create_user(email, password, first_name, last_name, is_admin):
         return new_user
 
 
-@manager.command
-def elastic_rebuild():
-    rebuild_elastic_index()
+@manager.option('-w', '--workers', dest='workers', default=4)
+def elastic_rebuild(workers):
+    """Rebuild elastic index without search downtime.
+
+    Documents deleted during the rebuild are removed from new index before the alias switch,
+    only documents deleted in the short time between the check and the switch stay in new index.
+    """
+    rebuild_elastic_index(workers=workers)
 
 
 @manager.command
@@ -52,11 +59,15 @@ def elastic_init():
 
 @manager.option('-h', '--hours', dest='hours', default=None)
 @manager.option('-c', '--collection', dest='collection', default=None)
-def index_from_mongo(hours, collection):
+@manager.option('-b', '--batch-size', dest='batch_size', default=500)
+@manager.option('-w', '--workers', dest='workers', default=4)
+@manager.option('-r', '--resume', dest='resume', action='store_true', default=False)
+def index_from_mongo(hours, collection, batch_size, workers, resume):
     print('Checking if elastic index exists, a new one will be created if not')
     app.data.init_elastic(app)
     print('Elastic index check has been completed')
-    index_elastic_from_mongo(hours=hours, collection=collection)
+    index_elastic_from_mongo(hours=hours, collection=collection, batch_size=batch_size, workers=workers,
+                             resume=resume)
 
 
 @manager.command
@@ -70,5 +81,17 @@ def send_company_expiry_alerts():
     CompanyExpiryAlerts().send_alerts()
 
 
+@manager.command
+def topics_percolator_sync():
+    """Register wire topics with notifications as percolator queries."""
+    print('Registered {} topics'.format(sync_topics()))
+
+
+@manager.option('-s', '--status', dest='status', default='pending')
+def push_requeue(status):
+    """Send stored pushes with given status (pending/processing/failed) to workers."""
+    print('Requeued pushes for {} items'.format(requeue_pushes(status)))
+
+
 if __name__ == "__main__":
     manager.run()
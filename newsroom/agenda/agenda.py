@@ -3,7 +3,7 @@ import logging
 from copy import deepcopy
 from content_api.items.resource import code_mapping
 from eve.utils import ParsedRequest, config
-from flask import json, abort, url_for, current_app as app
+from flask import json, abort, url_for, request, current_app as app
 from flask_babel import gettext
 from planning.common import WORKFLOW_STATE_SCHEMA, ASSIGNMENT_WORKFLOW_STATE
 from planning.events.events_schema import events_schema
@@ -16,11 +16,14 @@ import newsroom
 from newsroom.agenda.email import send_coverage_notification_email, send_agenda_notification_email
 from newsroom.auth import get_user
 from newsroom.companies import get_user_company
+from newsroom.email import pooled_emails
 from newsroom.notifications import push_notification
+from newsroom.notifications.dispatcher import NotificationDispatcher
+from newsroom.pagination import get_cursor_query, get_next_cursor
 from newsroom.template_filters import is_admin_or_internal, is_admin
 from newsroom.utils import get_user_dict, get_company_dict, filter_active_users
 from newsroom.wire.search import query_string, set_product_query, \
-    planning_items_query_string, nested_query
+    planning_items_query_string, nested_query, search_with_cached_aggregations
 from newsroom.wire.utils import get_local_date, get_end_date
 from datetime import datetime
 from newsroom.wire import url_for_wire
@@ -38,6 +41,8 @@ PLANNING_ITEMS_FIELDS = [
     'coverages',
     'display_dates'
 ]
+#: wire item fields used for completed coverages
+WIRE_DETAILS_FIELDS = ['_id', 'headline', 'slugline', 'description_text', 'firstpublished']
 
 
 agenda_notifications = {
@@ -257,6 +262,10 @@ class AgendaResource(newsroom.Resource):
         'default_sort': [('dates.start', 1)],
     }
 
+    mongo_indexes = {
+        'coverage_id': ([('coverages.coverage_id', 1)], ),
+    }
+
     item_methods = ['GET']
 
 
@@ -311,8 +320,8 @@ def _display_date_range(args):
 
 
 aggregations = {
-    'calendar': {'terms': {'field': 'calendars.name', 'size': 0}},
-    'location': {'terms': {'field': 'location.name', 'size': 0}},
+    'calendar': {'terms': {'field': 'calendars.name', 'size': 100}},
+    'location': {'terms': {'field': 'location.name', 'size': 100}},
     'service': {'terms': {'field': 'service.name', 'size': 50}},
     'subject': {'terms': {'field': 'subject.name', 'size': 20}},
     'urgency': {'terms': {'field': 'urgency'}},
@@ -456,23 +465,14 @@ class AgendaService(newsroom.Service):
 
     def on_fetched(self, doc):
         self.enhance_items(doc[config.ITEMS])
+        doc['_next'] = get_next_cursor(doc[config.ITEMS], 'dates.start', request.args.get('after'))
 
     def on_fetched_item(self, doc):
         self.enhance_items([doc])
 
     def enhance_items(self, docs):
+        self.enhance_coverages(docs)
         for doc in docs:
-            # Enhance completed coverages in general - add story's abstract/headline/slugline
-            delivery_ids = [c.get('delivery_id') for c in (doc.get('coverages') or [])
-                            if c.get('delivery_id') and c['workflow_status'] == ASSIGNMENT_WORKFLOW_STATE.COMPLETED]
-            wire_search_service = get_resource_service('wire_search')
-            if delivery_ids:
-                wire_items = wire_search_service.get_items(delivery_ids)
-                if wire_items.count() > 0:
-                    for item in wire_items:
-                        c = [c for c in doc.get('coverages') if c.get('delivery_id') == item.get('_id')][0]
-                        self.enhance_coverage_with_wire_details(c, item)
-
             # Filter based on _inner_hits
             inner_hits = doc.pop('_inner_hits', None)
             if not inner_hits or not doc.get('planning_items'):
@@ -484,6 +484,27 @@ class AgendaService(newsroom.Service):
             doc['planning_items'] = [p for p in doc['planning_items'] or [] if p.get('guid') in items_by_key]
             doc['coverages'] = [c for c in (doc.get('coverages') or []) if c.get('planning_id') in items_by_key]
 
+    def enhance_coverages(self, docs):
+        """Enhance completed coverages with story's abstract/headline/slugline.
+
+        Stories for all coverages are fetched using single search request.
+        """
+        coverages_by_delivery = {}
+        for doc in docs:
+            for coverage in (doc.get('coverages') or []):
+                if coverage.get('delivery_id') and \
+                        coverage.get('workflow_status') == ASSIGNMENT_WORKFLOW_STATE.COMPLETED:
+                    coverages_by_delivery.setdefault(coverage['delivery_id'], []).append(coverage)
+
+        if not coverages_by_delivery:
+            return
+
+        wire_items = get_resource_service('wire_search').get_items(list(coverages_by_delivery.keys()),
+                                                                   fields=WIRE_DETAILS_FIELDS)
+        for item in (wire_items or []):
+            for coverage in coverages_by_delivery.get(item['_id'], []):
+                self.enhance_coverage_with_wire_details(coverage, item)
+
     def enhance_coverage_with_wire_details(self, coverage, wire_item):
         coverage['item_description_text'] = wire_item.get('description_text')
         coverage['item_headline'] = wire_item.get('headline')
@@ -545,6 +566,12 @@ class AgendaService(newsroom.Service):
             if not is_events_only:
                 query['bool']['should'].append(_display_date_range(req.args))
 
+        if req.args.get('after'):
+            cursor_query = get_cursor_query(req.args['after'], 'dates.start', 'asc')
+            if not cursor_query:
+                return abort(400)
+            query['bool']['must'].append(cursor_query)
+
         source = {'query': query}
         source['sort'] = [{'dates.start': 'asc'}]
         source['size'] = 100  # we should fetch all items for given date
@@ -556,7 +583,8 @@ class AgendaService(newsroom.Service):
             # https://www.elastic.co/guide/en/elasticsearch/guide/current/pagination.html#pagination
             return abort(400)
 
-        if not source['from'] and not req.args.get('bookmarks'):  # avoid aggregations when handling pagination
+        # avoid aggregations when handling pagination
+        if not source['from'] and not req.args.get('after') and not req.args.get('bookmarks'):
             source['aggs'] = get_agenda_aggregations(is_events_only)
 
         if not is_admin_or_internal(user):
@@ -567,9 +595,12 @@ class AgendaService(newsroom.Service):
             query['bool']['must'].append({'exists': {'field': 'event_id'}})
             _remove_fields(source, PLANNING_ITEMS_FIELDS)
 
-        internal_req = ParsedRequest()
-        internal_req.args = {'source': json.dumps(source)}
-        cursor = super().get(internal_req, lookup)
+        def search(source):
+            internal_req = ParsedRequest()
+            internal_req.args = {'source': json.dumps(source)}
+            return super(AgendaService, self).get(internal_req, lookup)
+
+        cursor = search_with_cached_aggregations(self.datasource, source, search)
 
         if req.args.get('date_from') and req.args.get('date_to'):
             date_range = _get_date_filters(req.args)
@@ -710,24 +741,8 @@ class AgendaService(newsroom.Service):
 
             return False
 
-        query = {
-            'bool': {
-                'must': [
-                    {'nested': {
-                        'path': 'coverages',
-                        'query': {
-                            'bool': {
-                                'must': [
-                                    {'term': {'coverages.coverage_id': wire_item['coverage_id']}}
-                                ]
-                            }
-                        },
-                    }}
-                ],
-            }
-        }
-
-        agenda_items = self.get_items_by_query(query)
+        # use mongo index instead of search, agenda might not be refreshed in elastic yet
+        agenda_items = list(self.get_from_mongo(req=None, lookup={'coverages.coverage_id': wire_item['coverage_id']}))
         for item in agenda_items:
             wire_item.setdefault('agenda_id', item['_id'])
             wire_item.setdefault('agenda_href', url_for('agenda.item', _id=item['_id']))
@@ -751,9 +766,10 @@ class AgendaService(newsroom.Service):
         user_dict = get_user_dict()
         company_dict = get_company_dict()
         notify_user_ids = filter_active_users(agenda.get('watches', []), user_dict, company_dict, events_only=True)
-        for user_id in notify_user_ids:
-            user = user_dict[str(user_id)]
-            send_coverage_notification_email(user, agenda, wire_item)
+        with pooled_emails():
+            for user_id in notify_user_ids:
+                user = user_dict[str(user_id)]
+                send_coverage_notification_email(user, agenda, wire_item)
 
     def notify_agenda_update(self, update, agenda, events_only=False):
         if agenda:
@@ -761,17 +777,17 @@ class AgendaService(newsroom.Service):
             company_dict = get_company_dict()
             notify_user_ids = filter_active_users(agenda.get('watches', []), user_dict, company_dict, events_only)
             users = [user_dict[str(user_id)] for user_id in notify_user_ids]
-            for user in users:
-                app.data.insert('notifications', [{
-                    'item': agenda['_id'],
-                    'user': user['_id']
-                }])
-                send_agenda_notification_email(
-                    user,
-                    agenda,
-                    agenda_notifications[update]['message'],
-                    agenda_notifications[update]['subject'],
-                )
+            with NotificationDispatcher(agenda['_id']) as dispatcher:
+                dispatcher.add_users([user['_id'] for user in users])
+                for user in users:
+                    dispatcher.add_email(
+                        user,
+                        send_agenda_notification_email,
+                        user,
+                        agenda,
+                        agenda_notifications[update]['message'],
+                        agenda_notifications[update]['subject'],
+                    )
             push_notification('agenda_update',
                               item=agenda,
                               users=notify_user_ids)
@@ -786,6 +802,75 @@ class AgendaService(newsroom.Service):
         cursor = self.get_items_by_query(query, size=0)
         return cursor.count()
 
+    def get_feed_source(self, user, topic=None):
+        """Get search source for user calendar feed.
+
+        Feed contains events watched by user or events matching given agenda topic,
+        which didn't finish more than ``AGENDA_FEED_DAYS`` ago.
+
+        :param user: feed user
+        :param topic: agenda topic
+        """
+        query = _agenda_query()
+        company = get_user_company(user)
+        is_events_only = is_events_only_access(user, company)
+        get_resource_service('section_filters').apply_section_filter(query, self.section)
+        product_query = {'bool': {'must': [], 'should': []}}
+        set_product_query(
+            product_query,
+            company,
+            self.section,
+            user=user,
+            navigation_id=topic.get('navigation') if topic else None,
+            events_only=is_events_only
+        )
+        query['bool']['must'].append(product_query)
+        query['bool']['must'].append({
+            'range': {'dates.end': {'gte': 'now-{}d/d'.format(app.config.get('AGENDA_FEED_DAYS', 30))}},
+        })
+
+        if topic:
+            if topic.get('query'):
+                query['bool']['must'].append(get_agenda_query(topic['query'], is_events_only))
+            if topic.get('filter'):
+                filters = _filter_terms(topic['filter'], is_events_only)
+                query['bool']['must'] += filters['must_term_filters']
+                query['bool']['must_not'] += filters['must_not_term_filters']
+        else:
+            set_saved_items_query(query, str(user['_id']))
+
+        source = {'query': query, 'sort': [{'dates.start': 'asc'}], 'size': app.config.get('AGENDA_FEED_SIZE', 500)}
+
+        if not is_admin_or_internal(user):
+            _remove_fields(source, PRIVATE_FIELDS)
+
+        if is_events_only:
+            query['bool']['must'].append({'exists': {'field': 'event_id'}})
+            _remove_fields(source, PLANNING_ITEMS_FIELDS)
+
+        return source
+
+    def get_feed_stats(self, source):
+        """Get number of items and last ``_updated`` for feed source.
+
+        It's used to check if feed was modified without fetching the items.
+        """
+        stats_source = {
+            'query': source['query'],
+            'size': 0,
+            'aggs': {'last_updated': {'max': {'field': '_updated'}}},
+        }
+        req = ParsedRequest()
+        req.args = {'source': json.dumps(stats_source)}
+        cursor = super().get(req, None)
+        last_updated = cursor.hits.get('aggregations', {}).get('last_updated', {}).get('value')
+        return cursor.count(), datetime.utcfromtimestamp(last_updated / 1000) if last_updated else None
+
+    def get_feed_items(self, source):
+        req = ParsedRequest()
+        req.args = {'source': json.dumps(source)}
+        return super().get(req, None)
+
     def get_featured_stories(self, req, lookup):
         for_date = datetime.strptime(req.args.get('date_from'), '%d/%m/%Y %H:%M')
         offset = int(req.args.get('timezone_offset', '0'))
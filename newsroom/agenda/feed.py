@@ -0,0 +1,103 @@
+"""Calendar feed for agenda items users can subscribe to in their calendar clients.
+
+Calendar clients can't login, so feed url contains signed token with user id,
+optionally agenda topic id and user feed secret. Feed secret is stored on user
+and can be reset, which revokes all feed urls generated for user before.
+"""
+
+import hmac
+import hashlib
+
+from uuid import uuid4
+from flask import current_app as app, url_for
+from itsdangerous import URLSafeSerializer, BadSignature
+from superdesk import get_resource_service
+
+from newsroom.cache import get_cache_version, invalidate_cache
+
+FEED_TOKEN_SALT = 'agenda-feed'
+
+
+def _get_serializer():
+    return URLSafeSerializer(app.config['SECRET_KEY'], salt=FEED_TOKEN_SALT)
+
+
+def get_feed_secret(user):
+    """Get feed secret for user, generating new one if user has none.
+
+    :param user: user dict
+    """
+    if not user.get('feed_secret'):
+        reset_feed_secret(user)
+    return user['feed_secret']
+
+
+def reset_feed_secret(user):
+    """Generate new feed secret for user, feed urls using previous one stop working.
+
+    :param user: user dict
+    """
+    updates = {'feed_secret': uuid4().hex}
+    get_resource_service('users').system_update(user['_id'], updates, user)
+    user.update(updates)
+
+
+def generate_feed_token(user, topic=None):
+    """Generate feed token for user.
+
+    :param user: user dict
+    :param topic: agenda topic, if not set feed contains watched events
+    """
+    return _get_serializer().dumps({
+        'user': str(user['_id']),
+        'topic': str(topic['_id']) if topic else None,
+        'secret': get_feed_secret(user),
+    })
+
+
+def verify_feed_token(token):
+    """Get data from feed token.
+
+    :param token: feed token
+    :return: dict with ``user``, ``topic`` ids and ``secret`` or ``None`` if token is not valid
+    """
+    try:
+        return _get_serializer().loads(token)
+    except BadSignature:
+        return None
+
+
+def verify_feed_secret(data, user):
+    """Test if feed token data contain current feed secret of user.
+
+    :param data: feed token data
+    :param user: user dict
+    """
+    return bool(user.get('feed_secret')) and hmac.compare_digest(str(data.get('secret') or ''), user['feed_secret'])
+
+
+def get_feed_url(user, topic=None):
+    return url_for('agenda.feed', token=generate_feed_token(user, topic), _external=True)
+
+
+def invalidate_feed(user_id):
+    """Invalidate feed etag for user when items watched by user are changed.
+
+    Watching an item doesn't change its ``_updated`` time, so it's not detected by feed stats.
+    """
+    invalidate_cache('agenda_feed', str(user_id))
+
+
+def get_feed_etag(token, user, count, last_updated):
+    """Get feed etag which changes when any item in feed, watched items or user permissions are changed."""
+    key = [
+        token,
+        str(count),
+        last_updated.isoformat() if last_updated else '',
+        get_cache_version('users', str(user['_id'])),
+        get_cache_version('agenda_feed', str(user['_id'])),
+        get_cache_version('companies'),
+        get_cache_version('products'),
+        get_cache_version('topics'),
+    ]
+    return hashlib.sha1(':'.join(key).encode('utf-8')).hexdigest()
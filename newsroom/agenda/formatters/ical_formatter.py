@@ -37,14 +37,33 @@ class iCalFormatter(BaseFormatter):
     PRODID = 'Newshub'
     FILE_EXTENSION = 'ical'
     MIMETYPE = 'text/calendar'
+    MULTIPLE_ITEMS = True
 
-    def format_item(self, item, item_type=None):
+    def get_calendar(self):
         cal = icalendar.Calendar()
         cal['version'] = self.VERSION
         cal['prodid'] = self.PRODID
+        return cal
+
+    def format_item(self, item, item_type=None):
+        cal = self.get_calendar()
         cal.add_component(self.format_event(item))
         return cal.to_ical()
 
+    def format_items(self, items, item_type=None):
+        """Generate single calendar with event for every item.
+
+        Events are serialized one by one so the whole calendar is never kept in memory.
+        """
+        empty = self.get_calendar().to_ical()
+        footer = b'END:VCALENDAR\r\n'
+        if not empty.endswith(footer):
+            raise ValueError('Unexpected calendar footer: {}'.format(empty[-len(footer):]))
+        yield empty[:-len(footer)]
+        for item in items:
+            yield self.format_event(item).to_ical()
+        yield footer
+
     def format_event(self, item):
         event = icalendar.Event()
         event.add('uid', guid(item))
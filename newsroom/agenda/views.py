@@ -2,7 +2,9 @@ from newsroom.agenda import blueprint
 
 import flask
 
+from bson import ObjectId
 from flask import current_app as app
+from werkzeug.http import is_resource_modified
 from eve.methods.get import get_internal
 from eve.render import send_response
 from superdesk import get_resource_service
@@ -10,13 +12,16 @@ from superdesk import get_resource_service
 from newsroom.template_filters import is_admin_or_internal, is_admin
 from newsroom.topics import get_user_topics
 from newsroom.navigations.navigations import get_navigations_by_company
-from newsroom.auth import get_user, login_required
+from newsroom.auth import get_user, get_user_id, login_required
 from newsroom.utils import get_entity_or_404, is_json_request, get_json_or_400, \
     get_agenda_dates, get_location_string, get_public_contacts, get_links
 from newsroom.wire.utils import update_action_list
 from newsroom.agenda.email import send_coverage_request_email
 from newsroom.companies import section, get_user_company
 from newsroom.notifications import push_user_notification
+from newsroom.agenda.feed import verify_feed_token, verify_feed_secret, get_feed_etag, get_feed_url, \
+    reset_feed_secret, invalidate_feed
+from newsroom.auth.utils import is_company_enabled
 
 
 @blueprint.route('/agenda')
@@ -103,10 +108,58 @@ def get_view_data():
                                                   product_type='agenda',
                                                   events_only=company.get('events_only', False)),
         'saved_items': get_resource_service('agenda').get_saved_items_count(),
-        'events_only': company.get('events_only', False)
+        'events_only': company.get('events_only', False),
+        'feed_url': get_feed_url(user) if user else None,
     }
 
 
+@blueprint.route('/agenda/feed/<token>.ics')
+def feed(token):
+    """Calendar feed with watched events or events matching agenda topic.
+
+    Clients polling the feed get ``304`` unless any item in feed was changed.
+    """
+    data = verify_feed_token(token)
+    if not data:
+        flask.abort(404)
+
+    user = get_resource_service('users').find_one(req=None, _id=ObjectId(data['user']))
+    if not user or not verify_feed_secret(data, user) or not user.get('is_enabled') or not is_company_enabled(user):
+        flask.abort(404)
+
+    topic = None
+    if data.get('topic'):
+        topic = get_resource_service('topics').find_one(req=None, _id=ObjectId(data['topic']))
+        if not topic or topic.get('user') != user['_id'] or topic.get('topic_type') != 'agenda':
+            flask.abort(404)
+
+    service = get_resource_service('agenda')
+    source = service.get_feed_source(user, topic)
+    count, last_updated = service.get_feed_stats(source)
+    etag = get_feed_etag(token, user, count, last_updated)
+
+    if not is_resource_modified(flask.request.environ, etag=etag, last_modified=last_updated):
+        response = flask.Response(status=304)
+    else:
+        formatter = app.download_formatters['ical']['formatter']
+        content = formatter.format_items(service.get_feed_items(source), 'agenda')
+        response = flask.Response(flask.stream_with_context(content), mimetype=formatter.MIMETYPE)
+    response.set_etag(etag)
+    response.last_modified = last_updated
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@blueprint.route('/agenda/feed/reset', methods=['POST'])
+@login_required
+def reset_feed():
+    """Reset feed secret of current user, so feed urls shared before stop working."""
+    user = get_user(required=True)
+    reset_feed_secret(user)
+    return flask.jsonify({'feed_url': get_feed_url(user)}), 200
+
+
 @blueprint.route('/agenda/request_coverage', methods=['POST'])
 @login_required
 def request_coverage():
@@ -125,6 +178,7 @@ def bookmark():
     data = get_json_or_400()
     assert data.get('items')
     update_action_list(data.get('items'), 'bookmarks', item_type='agenda')
+    invalidate_feed(get_user_id())
     push_user_notification('saved_items', count=get_resource_service('agenda').get_saved_items_count())
     return flask.jsonify(), 200
 
@@ -135,5 +189,6 @@ def follow():
     data = get_json_or_400()
     assert data.get('items')
     update_action_list(data.get('items'), 'watches', item_type='agenda')
+    invalidate_feed(get_user_id())
     push_user_notification('saved_items', count=get_resource_service('agenda').get_saved_items_count())
     return flask.jsonify(), 200
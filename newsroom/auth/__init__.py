@@ -5,6 +5,7 @@ from bson import ObjectId
 from eve.auth import BasicAuth
 from flask import Blueprint, session, abort
 
+from newsroom.cache import get_cached
 from .decorator import login_required, admin_only  # noqa
 
 blueprint = Blueprint('auth', __name__)
@@ -24,7 +25,8 @@ def get_user(required=False):
     """
     user_id = get_user_id()
     if user_id:
-        user = superdesk.get_resource_service('users').find_one(req=None, _id=user_id)
+        user = get_cached('users', str(user_id), lambda: superdesk.get_resource_service('users').find_one(
+            req=None, _id=user_id))
     else:
         user = None
     if not user and required:
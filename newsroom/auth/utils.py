@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from superdesk import get_resource_service
+
+from newsroom.template_filters import is_admin
+
+
+def is_company_enabled(user):
+    """
+    Checks if the company of the user is enabled
+    """
+    if not user.get('company'):
+        # there's no company assigned return true for admin user else false
+        return True if is_admin(user) else False
+
+    company = get_resource_service('companies').find_one(req=None, _id=user.get('company'))
+    if not company:
+        return False
+
+    return company.get('is_enabled', False) and not is_company_expired(company)
+
+
+def is_company_expired(company):
+    expiry_date = company.get('expiry_date')
+    if not expiry_date:
+        return False
+    return expiry_date.replace(tzinfo=None) <= datetime.utcnow().replace(tzinfo=None)
@@ -1,4 +1,3 @@
-from datetime import datetime
 from datetime import timedelta
 
 import bcrypt
@@ -17,6 +16,7 @@ from newsroom.utils import get_random_string
 from newsroom.limiter import limiter
 from newsroom.template_filters import is_admin
 from .token import generate_auth_token, verify_auth_token
+from .utils import is_company_enabled
 
 
 @blueprint.route('/login', methods=['GET', 'POST'])
@@ -38,7 +38,7 @@ def login():
                 flask.flash(gettext('Insufficient Permissions. Access denied.'), 'danger')
                 return flask.render_template('login.html', form=form)
 
-            if not _is_company_enabled(user):
+            if not is_company_enabled(user):
                 flask.flash(gettext('Company account has been disabled.'), 'danger')
                 return flask.render_template('login.html', form=form)
 
@@ -118,28 +118,6 @@ def _is_password_valid(password, user):
     return True
 
 
-def _is_company_enabled(user):
-    """
-    Checks if the company of the user is enabled
-    """
-    if not user.get('company'):
-        # there's no company assigned return true for admin user else false
-        return True if is_admin(user) else False
-
-    company = get_resource_service('companies').find_one(req=None, _id=user.get('company'))
-    if not company:
-        return False
-
-    return company.get('is_enabled', False) and not _is_company_expired(company)
-
-
-def _is_company_expired(company):
-    expiry_date = company.get('expiry_date')
-    if not expiry_date:
-        return False
-    return expiry_date.replace(tzinfo=None) <= datetime.utcnow().replace(tzinfo=None)
-
-
 def _is_account_enabled(user):
     """
     Checks if user account is active and approved
@@ -186,7 +164,7 @@ def get_login_token():
     if user is not None and _is_password_valid(password.encode('UTF-8'), user):
         user = get_resource_service('users').find_one(req=None, _id=user['_id'])
 
-        if not _is_company_enabled(user):
+        if not is_company_enabled(user):
             abort(401, gettext('Company account has been disabled.'))
 
         if _is_account_enabled(user):
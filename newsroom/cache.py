@@ -0,0 +1,132 @@
+"""Cache for frequently used resources like users, companies and products.
+
+Values are cached per request in ``flask.g`` and across requests in ``app.cache``.
+Cross request cache keys contain resource version which is changed on every write,
+so there is no need to track individual keys when invalidating.
+
+Resources with many independent documents like users can be versioned per document,
+so that writing one document doesn't invalidate cached values of all others.
+"""
+
+import flask
+
+from copy import deepcopy
+from uuid import uuid4
+from flask import current_app as app
+
+
+def _get_version_key(resource, key=None):
+    if key is None:
+        return 'resource-cache-version:{}'.format(resource)
+    return 'resource-cache-version:{}:{}'.format(resource, key)
+
+
+def get_cache_version(resource, key=None):
+    """Get current cache version for resource.
+
+    :param resource: resource name
+    :param key: document key, if set returns version of this document
+    """
+    version_key = _get_version_key(resource)
+    if key is None:
+        version = app.cache.get(version_key)
+    else:
+        version, document_version = app.cache.get_many(version_key, _get_version_key(resource, key))
+    if version is None:
+        app.cache.add(version_key, uuid4().hex, timeout=0)  # other process might have set it already
+        version = app.cache.get(version_key)
+    if key is None:
+        return version
+    return '{}:{}'.format(version, document_version or '')
+
+
+def _get_request_cache():
+    if not flask.has_app_context():
+        return None
+    if flask.g.get('resource_cache') is None:
+        flask.g.resource_cache = {}
+    return flask.g.resource_cache
+
+
+def get_cached(resource, key, getter):
+    """Get value from cache, calling getter if it's not cached yet.
+
+    Returns a copy of the cached value, so it can be modified by caller.
+
+    :param resource: resource name, used for invalidation
+    :param key: cache key unique within resource
+    :param getter: function returning the value
+    """
+    request_cache = _get_request_cache()
+    request_key = (resource, key)
+    if request_cache is not None and request_key in request_cache:
+        return deepcopy(request_cache[request_key])
+
+    cache_key = 'resource-cache:{}:{}:{}'.format(resource, get_cache_version(resource, key), key)
+    cached = app.cache.get(cache_key)
+    if cached is None:
+        cached = (getter(), )  # wrap it so we can cache None
+        app.cache.set(cache_key, cached, timeout=app.config.get('RESOURCE_CACHE_TIMEOUT', 300))
+
+    if request_cache is not None:
+        request_cache[request_key] = cached[0]
+    return deepcopy(cached[0])
+
+
+def invalidate_cache(resource, key=None):
+    """Invalidate cached values for given resource.
+
+    :param resource: resource name
+    :param key: document key, if set only values cached using this key are invalidated
+    """
+    app.cache.set(_get_version_key(resource, key), uuid4().hex, timeout=0)
+    request_cache = _get_request_cache()
+    if request_cache:
+        for request_key in [request_key for request_key in request_cache
+                            if request_key[0] == resource and (key is None or request_key[1] == key)]:
+            request_cache.pop(request_key)
+
+
+class CachedResourceServiceMixin():
+    """Service mixin invalidating resource cache on every write.
+
+    Set ``cache_per_document`` for resources cached only using document ids,
+    updates will then invalidate only the updated document.
+    """
+
+    cache_per_document = False
+
+    def _invalidate_cache(self, id=None):
+        if self.cache_per_document and id is not None:
+            invalidate_cache(self.datasource, str(id))
+        else:
+            invalidate_cache(self.datasource)
+
+    def create(self, docs, **kwargs):
+        ids = super().create(docs, **kwargs)
+        if self.cache_per_document:
+            for id in ids:
+                self._invalidate_cache(id)
+        else:
+            self._invalidate_cache()
+        return ids
+
+    def update(self, id, updates, original):
+        res = super().update(id, updates, original)
+        self._invalidate_cache(id)
+        return res
+
+    def system_update(self, id, updates, original):
+        res = super().system_update(id, updates, original)
+        self._invalidate_cache(id)
+        return res
+
+    def replace(self, id, document, original):
+        res = super().replace(id, document, original)
+        self._invalidate_cache(id)
+        return res
+
+    def delete(self, lookup):
+        res = super().delete(lookup)
+        self._invalidate_cache()
+        return res
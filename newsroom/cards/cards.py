@@ -1,5 +1,7 @@
 import newsroom
 
+from newsroom.cache import CachedResourceServiceMixin
+
 
 class CardsResource(newsroom.Resource):
     """
@@ -50,5 +52,5 @@ class CardsResource(newsroom.Resource):
     resource_methods = ['GET', 'POST']
 
 
-class CardsService(newsroom.Service):
+class CardsService(CachedResourceServiceMixin, newsroom.Service):
     pass
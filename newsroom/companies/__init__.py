@@ -4,6 +4,7 @@ from functools import wraps
 from flask import Blueprint, abort, current_app as newsroom_app
 from flask_babel import gettext
 from newsroom.auth import get_user
+from newsroom.cache import get_cached
 from .companies import CompaniesResource, CompaniesService
 
 blueprint = Blueprint('companies', __name__)
@@ -11,9 +12,14 @@ blueprint = Blueprint('companies', __name__)
 from . import views   # noqa
 
 
+def get_company(company_id):
+    return get_cached('companies', str(company_id), lambda: superdesk.get_resource_service('companies').find_one(
+        req=None, _id=company_id))
+
+
 def get_user_company(user):
     if user and user.get('company'):
-        return superdesk.get_resource_service('companies').find_one(req=None, _id=user['company'])
+        return get_company(user['company'])
 
 
 def get_company_sections(company_id):
@@ -21,7 +27,7 @@ def get_company_sections(company_id):
     if not company_id:
         return newsroom_app.sections
 
-    company = superdesk.get_resource_service('companies').find_one(req=None, _id=company_id)
+    company = get_company(company_id)
     if not company or not company.get('sections'):
         return newsroom_app.sections
 
@@ -1,6 +1,8 @@
 
 import newsroom
 from content_api import MONGO_PREFIX
+from newsroom.cache import CachedResourceServiceMixin
+from newsroom.topics.percolator import PercolatorSyncServiceMixin
 
 
 class CompaniesResource(newsroom.Resource):
@@ -65,5 +67,5 @@ class CompaniesResource(newsroom.Resource):
     mongo_prefix = MONGO_PREFIX
 
 
-class CompaniesService(newsroom.Service):
+class CompaniesService(PercolatorSyncServiceMixin, CachedResourceServiceMixin, newsroom.Service):
     pass
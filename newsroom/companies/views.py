@@ -9,7 +9,9 @@ from superdesk import get_resource_service
 from werkzeug.exceptions import NotFound
 
 from newsroom.auth.decorator import admin_only, login_required
+from newsroom.cache import invalidate_cache
 from newsroom.companies import blueprint
+from newsroom.topics import percolator
 from newsroom.utils import query_resource, find_one, get_entity_or_404, get_json_or_400
 
 
@@ -128,6 +130,8 @@ def update_products(updates, company_id):
             db.update_one({'_id': product['_id']}, {'$addToSet': {'companies': company_id}})
         else:
             db.update_one({'_id': product['_id']}, {'$pull': {'companies': company_id}})
+    invalidate_cache('products')
+    percolator.sync_topics_async()
 
 
 def update_company(data, _id):
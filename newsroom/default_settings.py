@@ -148,6 +148,10 @@ MAXIMUM_FAILED_LOGIN_ATTEMPTS = 5
 MAIL_DEFAULT_SENDER = MAIL_USERNAME or 'newsroom@localhost'
 # Recipients for the sign up form filled by new users (single or comma separated)
 SIGNUP_EMAIL_RECIPIENTS = os.environ.get('SIGNUP_EMAIL_RECIPIENTS')
+#: number of notification emails sent using single smtp connection
+MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 100))
+#: max number of smtp connections used in parallel when sending notification emails
+MAIL_SEND_CONCURRENCY = int(os.environ.get('MAIL_SEND_CONCURRENCY', 1))
 
 #: public client url - used to create links within emails etc
 CLIENT_URL = 'http://localhost:5050'
@@ -164,6 +168,16 @@ CACHE_TYPE = os.environ.get('CACHE_TYPE', 'simple')  # in-memory cache
 CACHE_DEFAULT_TIMEOUT = 3600
 # Redis host (used only if CACHE_TYPE is redis)
 CACHE_REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379')
+# Timeout for cached users, companies and products in sec, cache is invalidated on changes
+RESOURCE_CACHE_TIMEOUT = 300
+# Max number of compiled product filters kept in memory per process
+PRODUCT_QUERY_CACHE_SIZE = 1000
+# Time in sec after which home card items are refreshed, cards matching pushed items are refreshed sooner
+HOME_CARD_CACHE_TIMEOUT = 300
+# Max time in sec to serve stale home card items while these are refreshed
+HOME_CARD_CACHE_STALE_TIMEOUT = 3600
+# Time in sec to reuse aggregations for searches with the same query and filters
+AGGREGATIONS_CACHE_TIMEOUT = 60
 
 # Recaptcha Settings
 RECAPTCHA_PUBLIC_KEY = os.environ.get('RECAPTCHA_PUBLIC_KEY')
@@ -183,9 +197,50 @@ NEWS_ONLY_FILTERS = [
 # the lifetime of a permanent session in seconds
 PERMANENT_SESSION_LIFETIME = 604800  # 7 days
 
+#: store pushed items and process them using celery workers, push returns ``202`` once payload is stored
+PUSH_QUEUE_ENABLED = False
+#: seconds to wait before retry when other worker is processing pushes for the same item
+PUSH_QUEUE_RETRY_COUNTDOWN = 2
+#: seconds after which push left in processing state by crashed worker is processed again
+PUSH_QUEUE_LEASE_TIMEOUT = 900
+
+#: match wire topics for notifications using elastic percolator,
+#: run ``manage.py topics_percolator_sync`` after enabling it, later changes of products, companies,
+#: section filters and users are synced using celery
+WIRE_NOTIFICATIONS_PERCOLATOR = False
+
+#: store history of user actions (downloads, prints, etc.) using celery workers
+HISTORY_ASYNC = False
+
+#: generate picture renditions using celery workers, items are indexed with placeholder renditions first
+RENDITIONS_ASYNC = False
+
+#: number of worker processes formatting items for multi item downloads, ``0`` formats items in web process
+DOWNLOAD_FORMAT_PROCESSES = int(os.environ.get('DOWNLOAD_FORMAT_PROCESSES', 0))
+#: min number of items in download to use worker processes for formatting
+DOWNLOAD_FORMAT_PROCESSES_MIN_ITEMS = 20
+#: seconds to wait for item formatted in worker process before the pool is considered broken
+DOWNLOAD_FORMAT_TIMEOUT = 60
+#: max total size in bytes of formatted items cached in memory per process, ``0`` disables the cache
+DOWNLOAD_CACHE_SIZE = int(os.environ.get('DOWNLOAD_CACHE_SIZE', 50 * 1024 * 1024))
+#: max size in bytes of single formatted item to be cached
+DOWNLOAD_CACHE_MAX_ITEM_SIZE = 1024 * 1024
+#: also store formatted items in redis so these are shared between processes
+DOWNLOAD_CACHE_REDIS = False
+#: timeout in seconds for formatted items stored in redis
+DOWNLOAD_CACHE_TIMEOUT = 24 * 3600
+
+#: max number of events in agenda calendar feed
+AGENDA_FEED_SIZE = 500
+#: include events in agenda calendar feed which ended within given number of days
+AGENDA_FEED_DAYS = 30
+
 # the time to live value in days for user notifications
 NOTIFICATIONS_TTL = 1
 
+#: cache timeout for notifications summary rendered on every page (seconds)
+NOTIFICATIONS_SUMMARY_TIMEOUT = 3600
+
 WEBSOCKET_EXCHANGE = celery_queue('newsroom_notification')
 
 SERVICES = [
@@ -261,7 +316,23 @@ CELERY_TASK_ROUTES = {
     'newsroom.company_expiry': {
         'queue': celery_queue('newsroom'),
         'routing_key': 'newsroom.company_expiry'
-    }
+    },
+    'newsroom.push.*': {
+        'queue': celery_queue('newsroom'),
+        'routing_key': 'newsroom.push'
+    },
+    'newsroom.history.*': {
+        'queue': celery_queue('newsroom'),
+        'routing_key': 'newsroom.history'
+    },
+    'newsroom.media_utils.*': {
+        'queue': celery_queue('newsroom'),
+        'routing_key': 'newsroom.media_utils'
+    },
+    'newsroom.topics.*': {
+        'queue': celery_queue('newsroom'),
+        'routing_key': 'newsroom.topics'
+    },
 }
 
 #: celery beat config
@@ -269,5 +340,9 @@ CELERY_BEAT_SCHEDULE = {
     'newsroom:company_expiry': {
         'task': 'newsroom.company_expiry',
         'schedule': crontab(hour=0, minute=0),  # Runs every day at midnight
-    }
+    },
+    'newsroom:requeue_expired_pushes': {
+        'task': 'newsroom.push.requeue_expired_pushes',
+        'schedule': crontab(minute='*/5'),
+    },
 }
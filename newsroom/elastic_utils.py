@@ -1,42 +1,195 @@
 """
-Copy of superdesk.commands.rebuild_elastic_index
+Rebuild elastic index without search downtime.
+
+New index is populated while the alias still points to the old one, documents written
+in the meantime are copied using ``_updated`` and documents deleted in the meantime
+are removed by comparing ids of both indexes. Then the alias is switched atomically.
+
+Documents deleted between the ids comparison and the alias switch are not removed
+from new index, the window is short but not empty.
 """
 
 import elasticsearch
 
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from elasticsearch.helpers import bulk, reindex, scan
 from flask import current_app as app
-from eve_elastic import get_es, get_indices, reindex
+from eve_elastic import get_es, get_indices
+from eve_elastic.elastic import generate_index_name
+from superdesk.utc import utcnow
 
+#: time subtracted from catch up start to cover slow writes
+CATCH_UP_MARGIN = timedelta(minutes=1)
+CHUNK_SIZE = 500
 
-def rebuild_elastic_index():
+
+def rebuild_elastic_index(workers=4):
     index_name = app.config['CONTENTAPI_ELASTICSEARCH_INDEX']
     try:
         es = get_es(app.config['CONTENTAPI_ELASTICSEARCH_URL'])
         print('rebuilding index', index_name)
 
-        # remove alias from current index
         old_index = app.data.elastic.get_index_by_alias(index_name)
-        print('removing old index alias', old_index)
-        get_indices(es).delete_alias(name=index_name, index=old_index)
+        new_index = generate_index_name(index_name)
 
-        # create new index
-        print('creating new index')
-        app.data.elastic.create_index(index_name, app.config['ELASTICSEARCH_SETTINGS'])
-        new_index = app.data.elastic.get_index_by_alias(index_name)
+        print('creating new index', new_index)
+        get_indices(es).create(index=new_index, body=app.config['ELASTICSEARCH_SETTINGS'])
 
         print('putting mapping to index', new_index)
         app.data.elastic.put_mapping(app, new_index)
 
         try:
             print('starting index rebuilding')
-            reindex(es, old_index, new_index)
+            started = utcnow()
+            count = copy_index(es, old_index, new_index, workers=int(workers))
+            print('copied {} documents'.format(count))
+
+            # copy documents updated while copying, alias still points to old index
+            since, started = started - CATCH_UP_MARGIN, utcnow()
+            count = copy_index(es, old_index, new_index, since=since)
+            print('copied {} documents updated during rebuild'.format(count))
+
+            # documents deleted while copying are only in new index
+            count = delete_missing(es, old_index, new_index)
+            print('deleted {} documents removed during rebuild'.format(count))
+
+            print('switching alias to new index', new_index)
+            switch_alias(es, index_name, old_index, new_index)
+
+            # copy documents updated before the alias switch, new index might have newer versions already
+            count = copy_index(es, old_index, new_index, since=started - CATCH_UP_MARGIN, only_newer=True)
+            print('copied {} documents updated during alias switch'.format(count))
             print('finished index rebuilding.')
-            print('deleting old index', old_index)
-            get_indices(es).delete(old_index)
         except elasticsearch.helpers.BulkIndexError as err:
             print('reindex error', err)
             print('keeping old index', old_index)
+            if app.data.elastic.get_index_by_alias(index_name) != new_index:
+                get_indices(es).delete(new_index)
+            return
+
+        print('deleting old index', old_index)
+        get_indices(es).delete(old_index)
 
         print('index rebuilt done successfully', index_name)
     except elasticsearch.exceptions.NotFoundError as nfe:
         print(nfe)
+
+
+def switch_alias(es, alias, old_index, new_index):
+    """Move alias from old index to new one in single atomic request."""
+    actions = [{'add': {'index': new_index, 'alias': alias}}]
+    if old_index != alias:
+        actions.insert(0, {'remove': {'index': old_index, 'alias': alias}})
+    get_indices(es).update_aliases(body={'actions': actions})
+
+
+def _get_ids(es, index):
+    """Get ``(type, id, parent)`` of all documents in index."""
+    query = {'query': {'match_all': {}}, '_source': False, 'fields': ['_parent']}
+    return set((hit['_type'], hit['_id'], hit.get('fields', {}).get('_parent'))
+               for hit in scan(es, index=index, query=query, size=CHUNK_SIZE))
+
+
+def delete_missing(es, source, target):
+    """Delete documents from target index which are not in source index.
+
+    :param es: elastic client
+    :param source: source index name
+    :param target: target index name
+    :return: number of deleted documents
+    """
+    missing = _get_ids(es, target) - _get_ids(es, source)
+    actions = []
+    for _type, _id, parent in missing:
+        action = {'_op_type': 'delete', '_index': target, '_type': _type, '_id': _id}
+        if parent:
+            action['_parent'] = parent
+        actions.append(action)
+    if actions:
+        bulk(es, actions, stats_only=True, raise_on_error=False)
+    return len(actions)
+
+
+def get_partitions(es, index, workers):
+    """Split documents into ``_updated`` ranges which can be copied in parallel.
+
+    Sliced scroll is not available in elastic 2.x, so use ranges of similar length
+    and one more for documents without ``_updated``.
+    """
+    partitions = [{'bool': {'must_not': {'exists': {'field': '_updated'}}}}]
+    stats = es.search(index=index, body={
+        'size': 0,
+        'aggs': {
+            'min': {'min': {'field': '_updated'}},
+            'max': {'max': {'field': '_updated'}},
+        },
+    })['aggregations']
+
+    if stats['min']['value'] is None:
+        return partitions
+
+    start, end = int(stats['min']['value']), int(stats['max']['value'])
+    step = max(1, (end - start + workers) // workers)
+    for gte in range(start, end + 1, step):
+        partitions.append({'range': {'_updated': {'gte': gte, 'lt': gte + step, 'format': 'epoch_millis'}}})
+    return partitions
+
+
+def copy_index(es, source, target, workers=1, since=None, only_newer=False):
+    """Copy documents from source index to target index.
+
+    :param es: elastic client
+    :param source: source index name
+    :param target: target index name
+    :param workers: number of partitions copied in parallel
+    :param since: only copy documents updated since given time
+    :param only_newer: skip documents which are in target index with same or newer ``_updated``
+    :return: number of copied documents
+    """
+    if since:
+        partitions = [{'range': {'_updated': {'gte': int(since.timestamp() * 1000), 'format': 'epoch_millis'}}}]
+    else:
+        partitions = get_partitions(es, source, workers)
+
+    copy = _copy_newer if only_newer else _copy
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(copy, es, source, target, query) for query in partitions]
+        return sum(future.result() for future in futures)
+
+
+def _copy(es, source, target, query):
+    success, _ = reindex(es, source, target, query={'query': query}, chunk_size=CHUNK_SIZE,
+                         bulk_kwargs={'stats_only': True})
+    return success
+
+
+def _copy_newer(es, source, target, query):
+    count = 0
+    docs = []
+    for hit in scan(es, index=source, query={'query': query}, size=CHUNK_SIZE):
+        docs.append(hit)
+        if len(docs) >= CHUNK_SIZE:
+            count += _bulk_newer(es, target, docs)
+            docs = []
+    if docs:
+        count += _bulk_newer(es, target, docs)
+    return count
+
+
+def _bulk_newer(es, target, docs):
+    existing = es.mget(index=target, body={
+        'docs': [{'_id': doc['_id'], '_type': doc['_type'], '_source': ['_updated']} for doc in docs],
+    })['docs']
+
+    actions = []
+    for doc, current in zip(docs, existing):
+        current_updated = current.get('_source', {}).get('_updated') if current.get('found') else None
+        if current_updated and current_updated >= doc['_source'].get('_updated', ''):
+            continue
+        doc['_index'] = target
+        actions.append(doc)
+
+    if actions:
+        bulk(es, actions, stats_only=True)
+    return len(actions)
@@ -1,11 +1,24 @@
+import flask
+import hashlib
+import logging
+
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from markupsafe import escape
 from superdesk.emails import SuperdeskMessage  # it handles some encoding issues
 from flask import current_app, render_template, url_for
-from flask_babel import gettext
+from flask_babel import gettext, get_locale
 
 from newsroom.utils import get_agenda_dates, get_location_string, get_links, \
     get_public_contacts
 from newsroom.template_filters import is_admin_or_internal
 
+logger = logging.getLogger(__name__)
+
+#: template variables which differ per recipient, these are substituted in cached templates
+EMAIL_USER_FIELDS = ('name', 'topic_name')
+EMAIL_RENDER_CACHE_TIMEOUT = 600
+
 
 def send_email(to, subject, text_body, html_body=None, sender=None, connection=None):
     """
@@ -15,6 +28,7 @@ def send_email(to, subject, text_body, html_body=None, sender=None, connection=N
     :param text_body: Text Body
     :param html_body: Html Body
     :param sender: Sender
+    :param connection: Mail connection to use, if not set it will use pool if active or new connection
     :return:
     """
     if sender is None:
@@ -25,9 +39,123 @@ def send_email(to, subject, text_body, html_body=None, sender=None, connection=N
     app = current_app._get_current_object()
     if connection:
         return connection.send(msg)
+    outbox = flask.g.get('email_outbox') if flask.has_app_context() else None
+    if outbox is not None:
+        outbox.append(msg)
+        return
     return app.mail.send(msg)
 
 
+@contextmanager
+def pooled_emails():
+    """Collect emails sent within the context and send them using pooled connections on exit.
+
+    Contexts can be nested, emails are sent when leaving the outermost one.
+    """
+    if flask.g.get('email_outbox') is not None:
+        yield flask.g.email_outbox
+        return
+
+    flask.g.email_outbox = []
+    try:
+        yield flask.g.email_outbox
+        outbox = flask.g.email_outbox
+    finally:
+        flask.g.email_outbox = None
+    send_emails(outbox)
+
+
+def _send_batch(app, messages):
+    """Send messages using single connection.
+
+    :return: number of messages which were not sent
+    """
+    sent = 0
+    with app.app_context():
+        try:
+            with app.mail.connect() as connection:
+                for msg in messages:
+                    connection.send(msg)
+                    sent += 1
+        except Exception:
+            logger.exception('Failed to send %d of %d emails in batch', len(messages) - sent, len(messages))
+    return len(messages) - sent
+
+
+def send_emails(messages):
+    """Send messages in batches, reusing single smtp connection per batch.
+
+    Batch size is set via ``MAIL_BATCH_SIZE`` and number of batches sent in parallel
+    via ``MAIL_SEND_CONCURRENCY``.
+
+    :param messages: list of messages
+    :return: number of messages which were not sent
+    """
+    if not messages:
+        return 0
+
+    app = current_app._get_current_object()
+    size = max(1, app.config.get('MAIL_BATCH_SIZE', 100))
+    batches = [messages[i:i + size] for i in range(0, len(messages), size)]
+    workers = min(len(batches), app.config.get('MAIL_SEND_CONCURRENCY', 1))
+
+    if workers <= 1:
+        failed = sum(_send_batch(app, batch) for batch in batches)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [(executor.submit(_send_batch, app, batch), batch) for batch in batches]
+        failed = 0
+        for future, batch in futures:
+            try:
+                failed += future.result()
+            except Exception:
+                logger.exception('Failed to send batch of %d emails', len(batch))
+                failed += len(batch)
+
+    if failed:
+        logger.error('Failed to send %d of %d emails', failed, len(messages))
+    return failed
+
+
+def _get_placeholder(field):
+    return '__newsroom_email_{}__'.format(field)
+
+
+def _get_item_version(item):
+    return [str(item.get(field) or '') for field in ('version', '_current_version', 'versioncreated', '_updated')]
+
+
+def render_item_template(template, item, **kwargs):
+    """Render item notification template, using cache for item specific part.
+
+    The template is rendered once per item version, template, locale and other simple
+    template arguments, user specific fields (see ``EMAIL_USER_FIELDS``) are rendered
+    as placeholders and replaced per recipient.
+
+    :param template: template name
+    :param item: item dict
+    :param kwargs: template arguments
+    """
+    user_fields = {field: kwargs.pop(field, None) for field in EMAIL_USER_FIELDS}
+    key_params = {key: value for key, value in kwargs.items() if isinstance(value, (str, bool, int, type(None)))}
+    key_params.update({field: bool(value) for field, value in user_fields.items()})
+    key = flask.json.dumps([template, item.get('_id'), _get_item_version(item), str(get_locale()), key_params],
+                           sort_keys=True)
+    cache_key = 'email-template:{}'.format(hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    rendered = current_app.cache.get(cache_key)
+    if rendered is None:
+        placeholders = {field: _get_placeholder(field) if value else value for field, value in user_fields.items()}
+        rendered = render_template(template, item=item, **kwargs, **placeholders)
+        current_app.cache.set(cache_key, rendered, timeout=EMAIL_RENDER_CACHE_TIMEOUT)
+
+    for field, value in user_fields.items():
+        if value:
+            rendered = rendered.replace(_get_placeholder(field),
+                                        str(escape(value)) if template.endswith('.html') else str(value))
+    return rendered
+
+
 def send_new_signup_email(user):
     app_name = current_app.config['SITE_NAME']
     url = url_for('settings.app', app_id='users', _external=True)
@@ -119,13 +247,12 @@ def _send_new_wire_notification_email(user, topic_name, item, section):
         is_topic=True,
         topic_name=topic_name,
         name=user.get('first_name'),
-        item=item,
         url=url,
         type='wire',
         section=section
     )
-    text_body = render_template('new_item_notification.txt', **kwargs)
-    html_body = render_template('new_item_notification.html', **kwargs)
+    text_body = render_item_template('new_item_notification.txt', item, **kwargs)
+    html_body = render_item_template('new_item_notification.html', item, **kwargs)
     send_email(to=recipients, subject=subject, text_body=text_body, html_body=html_body)
 
 
@@ -138,7 +265,6 @@ def _send_new_agenda_notification_email(user, topic_name, item):
         is_topic=True,
         topic_name=topic_name,
         name=user.get('first_name'),
-        item=item,
         url=url,
         type='agenda',
         dateString=get_agenda_dates(item),
@@ -148,8 +274,8 @@ def _send_new_agenda_notification_email(user, topic_name, item):
         is_admin=is_admin_or_internal(user),
         section='agenda'
     )
-    text_body = render_template('new_item_notification.txt', **kwargs)
-    html_body = render_template('new_item_notification.html', **kwargs)
+    text_body = render_item_template('new_item_notification.txt', item, **kwargs)
+    html_body = render_item_template('new_item_notification.html', item, **kwargs)
     send_email(to=recipients, subject=subject, text_body=text_body, html_body=html_body)
 
 
@@ -165,12 +291,12 @@ def _send_history_match_wire_notification_email(user, item, section):
     url = url_for('wire.item', _id=item['guid'], _external=True)
     recipients = [user['email']]
     subject = gettext('New update for your previously accessed story: {}'.format(item['headline']))
-    text_body = render_template(
+    text_body = render_item_template(
         'new_item_notification.txt',
+        item,
         app_name=app_name,
         is_topic=False,
         name=user.get('first_name'),
-        item=item,
         url=url,
         type='wire',
         section=section
@@ -184,12 +310,12 @@ def _send_history_match_agenda_notification_email(user, item):
     url = url_for('agenda.item', _id=item['guid'], _external=True)
     recipients = [user['email']]
     subject = gettext('New update for your previously accessed agenda: {}'.format(item['name']))
-    text_body = render_template(
+    text_body = render_item_template(
         'new_item_notification.txt',
+        item,
         app_name=app_name,
         is_topic=False,
         name=user.get('first_name'),
-        item=item,
         url=url,
         type='agenda',
         dateString=get_agenda_dates(item),
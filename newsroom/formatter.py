@@ -15,9 +15,21 @@ class BaseFormatter():
     #: File extension to use for downloaded file.
     FILE_EXTENSION = None
 
+    #: Formatter can put multiple items into single file using :meth:`format_items`,
+    #: otherwise multiple items are downloaded as zip file.
+    MULTIPLE_ITEMS = False
+
     def format_item(self, item, item_type=None):
         raise NotImplementedError
 
+    def format_items(self, items, item_type=None):
+        """Generate content of single file containing all items.
+
+        :param items: iterable of items
+        :param item_type: either items or agenda
+        """
+        raise NotImplementedError
+
     def format_filename(self, item):
         assert self.FILE_EXTENSION
         _id = (item.get('slugline', item['_id']) or item['_id']).replace(' ', '-').lower()
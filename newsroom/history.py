@@ -1,11 +1,14 @@
 
 import newsroom
 import pymongo.errors
-import werkzeug.exceptions
 
+from flask import current_app as app
 from superdesk.utc import utcnow
+from newsroom.celery_app import celery
 from newsroom.utils import query_resource
 
+DUPLICATE_KEY_ERROR = 11000
+
 
 class HistoryResource(newsroom.Resource):
     item_methods = ['GET']
@@ -42,13 +45,37 @@ class HistoryService(newsroom.Service):
                 'item': item['_id'],
                 'version': item.get('version', item.get('_current_version')),
                 'section': section,
+                '_created': now,
+                '_updated': now,
             }
 
-        for doc in docs:
-            try:
-                super().create([transform(doc)])
-            except (werkzeug.exceptions.Conflict, pymongo.errors.BulkWriteError):
-                continue
+        history = [transform(doc) for doc in docs]
+        if not history:
+            return []
+
+        if app.config.get('HISTORY_ASYNC'):
+            insert_history.delay(history)
+        else:
+            insert_history_docs(history)
+        return [doc['_id'] for doc in history]
+
+
+def insert_history_docs(docs):
+    """Insert history docs using single unordered insert ignoring duplicates.
+
+    :param docs: history docs
+    """
+    try:
+        app.data.get_mongo_collection('history').insert_many(docs, ordered=False)
+    except pymongo.errors.BulkWriteError as err:
+        errors = [error for error in err.details.get('writeErrors', []) if error.get('code') != DUPLICATE_KEY_ERROR]
+        if errors or err.details.get('writeConcernErrors'):
+            raise
+
+
+@celery.task(soft_time_limit=300)
+def insert_history(docs):
+    insert_history_docs(docs)
 
 
 def get_history_users(item_ids, active_user_ids, active_company_ids, section, action):
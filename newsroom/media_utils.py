@@ -1,8 +1,15 @@
 import io
+import logging
+import superdesk
+
+from copy import deepcopy
 from PIL import Image, ImageEnhance
 from flask import current_app as app
+from newsroom.celery_app import celery
 from newsroom.upload import ASSETS_RESOURCE
 
+logger = logging.getLogger(__name__)
+
 THUMBNAIL_SIZE = (640, 640)
 THUMBNAIL_QUALITY = 80
 
@@ -27,28 +34,51 @@ def store_image(image, filename=None, _id=None):
 
 
 def get_thumbnail(image):
-    image = image.copy()
-    image.thumbnail(THUMBNAIL_SIZE)
-    return image
+    """Get image resized to fit ``THUMBNAIL_SIZE``.
+
+    When image is not loaded yet, jpeg is decoded at reduced scale close to the thumbnail size
+    using draft mode, so full size image is never decoded. Otherwise it resizes the loaded
+    image directly instead of making full size copy first.
+    """
+    ratio = min(THUMBNAIL_SIZE[0] / image.width, THUMBNAIL_SIZE[1] / image.height)
+    if ratio >= 1:
+        return image.copy()
+    size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+    image.draft('RGB', size)
+    return image.resize(size, Image.ANTIALIAS)
+
+
+_watermarks = {}
+
+
+def get_watermark_image():
+    """Get watermark image and its alpha mask with opacity applied.
+
+    Watermark is loaded once per process and reused for every image.
+    """
+    path = app.config['WATERMARK_IMAGE']
+    if path not in _watermarks:
+        with open(path, mode='rb') as watermark_binary:
+            watermark_image = Image.open(watermark_binary)
+            watermark_image.load()
+        if watermark_image.mode != 'RGBA':
+            watermark_image = watermark_image.convert('RGBA')
+        set_opacity(watermark_image, 0.3)
+        _watermarks[path] = (watermark_image.convert('RGB'), watermark_image.split()[3])
+    return _watermarks[path]
 
 
 def get_watermark(image):
-    image = image.copy()
     if not app.config.get('WATERMARK_IMAGE'):
-        return image
-    if image.mode != 'RGBA':
-        image = image.convert('RGBA')
-    with open(app.config['WATERMARK_IMAGE'], mode='rb') as watermark_binary:
-        watermark_image = Image.open(watermark_binary)
-        set_opacity(watermark_image, 0.3)
-        watermark_layer = Image.new('RGBA', image.size)
-        watermark_layer.paste(watermark_image, (
-            image.size[0] - watermark_image.size[0],
-            int((image.size[1] - watermark_image.size[1]) * 0.66),
-        ))
-
-    watermark = Image.alpha_composite(image, watermark_layer)
-    return watermark.convert('RGB')
+        return image.copy()
+    watermark_image, mask = get_watermark_image()
+    # pasting using alpha mask gives the same result as compositing over opaque image
+    image = image.convert('RGB')
+    image.paste(watermark_image, (
+        image.size[0] - watermark_image.size[0],
+        int((image.size[1] - watermark_image.size[1]) * 0.66),
+    ), mask)
+    return image
 
 
 def set_opacity(image, opacity=1):
@@ -57,47 +87,135 @@ def set_opacity(image, opacity=1):
     image.putalpha(alpha)
 
 
-def generate_preview_details_renditions(picture):
-    """Generate preview and details rendition"""
+def open_image(media_id):
+    """Open image for media without decoding it."""
+    binary = app.media.get(media_id, resource=ASSETS_RESOURCE)
+    return Image.open(binary)
+
+
+def get_image(media_id, images=None):
+    """Get decoded image for media.
+
+    :param media_id: media id
+    :param images: dict of images already decoded, so every media is decoded only once
+    """
+    if images is not None and media_id in images:
+        return images[media_id]
+    image = open_image(media_id)
+    image.load()
+    if images is not None:
+        images[media_id] = image
+    return image
+
+
+def generate_preview_details_renditions(picture, images=None):
+    """Generate preview and details rendition
+
+    :param picture: picture item
+    :param images: dict of images already decoded by media id
+    """
     if not picture or not picture.get('renditions'):
         return
 
+    if images is None:
+        images = {}
+
     # add watermark to base/view images
     for key in ['base', 'view']:
         rendition = picture.get('renditions', {}).get('%sImage' % key)
         if rendition:
-            binary = app.media.get(rendition['media'], resource=ASSETS_RESOURCE)
-            im = Image.open(binary)
-            watermark = get_watermark(im)
+            watermark = get_watermark(get_image(rendition['media'], images))
             picture['renditions'].update({
                 '_newsroom_%s' % key: store_image(watermark,
                                                   _id='%s%s' % (rendition['media'], '_newsroom_%s' % key))
             })
 
 
+def get_source_rendition(picture):
+    """Get rendition used for generated thumbs."""
+    renditions = picture.get('renditions', {})
+    return renditions.get('4-3', renditions.get('viewImage'))
+
+
 def generate_renditions(item):
     picture = item.get('associations', {}).get('featuremedia', {})
     if not picture:
         return
 
     # use 4-3 rendition for generated thumbs
-    renditions = picture.get('renditions', {})
-    rendition = renditions.get('4-3', renditions.get('viewImage'))
+    rendition = get_source_rendition(picture)
     if not rendition:
         return
 
     # generate thumbnails
-    binary = app.media.get(rendition['media'], resource=ASSETS_RESOURCE)
-    im = Image.open(binary)
-    thumbnail = get_thumbnail(im)  # 4-3 rendition resized
-    watermark = get_watermark(im)  # 4-3 rendition with watermark
+    images = {}
+    thumbnail = get_thumbnail(open_image(rendition['media']))  # 4-3 rendition resized
+    watermark = get_watermark(get_image(rendition['media'], images))  # 4-3 rendition with watermark
     picture['renditions'].update({
         '_newsroom_thumbnail': store_image(thumbnail,
                                            _id='%s%s' % (rendition['media'], '_newsroom_thumbnail')),
         '_newsroom_thumbnail_large': store_image(watermark,
                                                  _id='%s%s' % (rendition['media'], '_newsroom_thumbnail_large')),
     })
-    app.generate_preview_details_renditions(picture)
+    if app.generate_preview_details_renditions is generate_preview_details_renditions:
+        app.generate_preview_details_renditions(picture, images)
+    else:
+        # custom implementation might not accept decoded images
+        app.generate_preview_details_renditions(picture)
+
+
+def set_placeholder_renditions(item):
+    """Set generated renditions without generating these.
+
+    Generated renditions are stored using ids based on source rendition,
+    so item can be indexed with final hrefs while images are generated
+    using :func:`generate_item_renditions` task.
+
+    :param item: item with featuremedia
+    :return: ``True`` if there are renditions to generate
+    """
+    picture = item.get('associations', {}).get('featuremedia', {})
+    rendition = get_source_rendition(picture) if picture else None
+    if not rendition:
+        return False
+
+    placeholders = {
+        '_newsroom_thumbnail': rendition['media'],
+        '_newsroom_thumbnail_large': rendition['media'],
+    }
+    for key in ['base', 'view']:
+        if picture['renditions'].get('%sImage' % key):
+            placeholders['_newsroom_%s' % key] = picture['renditions']['%sImage' % key]['media']
+
+    for name, media in placeholders.items():
+        media_id = '%s%s' % (media, name)
+        picture['renditions'][name] = {
+            'media': media_id,
+            'href': app.upload_url(media_id),
+            'mimetype': 'image/jpeg',
+        }
+    return True
+
+
+@celery.task(bind=True, soft_time_limit=300, max_retries=5, default_retry_delay=10)
+def generate_item_renditions(self, item_id):
+    """Generate renditions for item indexed with placeholder renditions and update it.
+
+    :param item_id: item id
+    """
+    service = superdesk.get_resource_service('content_api')
+    item = service.find_one(req=None, _id=item_id)
+    if not item or not item.get('associations', {}).get('featuremedia'):
+        return
+
+    original = deepcopy(item)
+    try:
+        app.generate_renditions(item)
+    except Exception as err:
+        logger.warning('Failed to generate renditions for item %s: %s', item_id, err)
+        raise self.retry(exc=err)
+
+    service.system_update(item_id, {'associations': item['associations']}, original)
 
 
 def init_app(app):
@@ -2,8 +2,10 @@
 import time
 import pymongo
 import superdesk
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 
+from elasticsearch.helpers import bulk
 from flask import current_app as app
 from superdesk.errors import BulkIndexError
 from superdesk import config
@@ -11,9 +13,27 @@ from superdesk.utc import utcnow
 
 
 default_page_size = 500
+default_workers = 4
+bulk_retries = 3
 
 
-def index_elastic_from_mongo(hours=None, collection=None):
+def get_checkpoints_collection():
+    return app.data.pymongo('items').db.index_checkpoints
+
+
+def index_elastic_from_mongo(hours=None, collection=None, batch_size=default_page_size, workers=default_workers,
+                             resume=False):
+    """Index items from mongo to elastic.
+
+    Each collection is split into ``_id`` range shards which are indexed in parallel, every shard is using
+    a single sorted cursor. Progress is stored after every batch so it can continue using ``resume``.
+
+    :param hours: only index items updated within given hours
+    :param collection: only index given collection
+    :param batch_size: number of items in single bulk request
+    :param workers: number of shards indexed in parallel
+    :param resume: continue previous indexing
+    """
     print('Starting indexing from mongodb for "items" collection hours={}'.format(hours))
 
     resources = app.data.get_elastic_resources()
@@ -24,55 +44,171 @@ def index_elastic_from_mongo(hours=None, collection=None):
 
     for resource in resources:
         print('Starting indexing collection {}'.format(resource))
+        checkpoint = get_checkpoint(resource) if resume else None
+        if checkpoint:
+            print('Resuming indexing collection {} from checkpoint'.format(resource))
+        else:
+            checkpoint = create_checkpoint(resource, hours, int(workers))
+
+        started = time.time()
+        pending = [shard for shard in checkpoint['shards'] if not shard.get('done')]
+        with ThreadPoolExecutor(max_workers=max(1, int(workers))) as executor:
+            futures = [
+                executor.submit(_index_shard, app._get_current_object(), resource, checkpoint, shard, int(batch_size))
+                for shard in pending
+            ]
+            count = sum(future.result() for future in futures)
+
+        superdesk.app.data._search_backend(resource)._refresh_resource_index(resource)
+        get_checkpoints_collection().delete_one({'_id': resource})
+        duration = time.time() - started
+        print('Finished indexing collection {}, {} items in {:.3f} seconds ({:.1f} docs/sec)'.format(
+            resource, count, duration, count / duration if duration else count))
+
+
+def get_checkpoint(resource):
+    return get_checkpoints_collection().find_one({'_id': resource})
+
+
+def create_checkpoint(resource, hours=None, shards=1):
+    """Split collection into shards and store checkpoint for it.
+
+    :param resource: resource name
+    :param hours: only index items updated within given hours
+    :param shards: number of shards
+    """
+    since = utcnow() - timedelta(hours=float(hours)) if hours else None
+    bounds = _get_shard_bounds(resource, _get_query(since), shards)
+    checkpoint = {
+        '_id': resource,
+        'since': since,
+        'shards': [
+            {'index': i, 'start': bounds[i], 'end': bounds[i + 1], 'last_id': None, 'done': False}
+            for i in range(len(bounds) - 1)
+        ],
+        'created': utcnow(),
+    }
+    get_checkpoints_collection().replace_one({'_id': resource}, checkpoint, upsert=True)
+    return checkpoint
+
+
+def _get_shard_bounds(resource, query, shards):
+    """Get ``_id`` bounds for shards using random sample of collection.
+
+    First and last bounds are ``None`` meaning there is no limit.
+    """
+    bounds = [None]
+    if shards > 1:
+        db = app.data.get_mongo_collection(resource)
+        sample = db.aggregate([
+            {'$match': query},
+            {'$sample': {'size': shards * 100}},
+            {'$project': {config.ID_FIELD: 1}},
+        ])
+        try:
+            ids = sorted(set(doc[config.ID_FIELD] for doc in sample))
+        except TypeError:  # mixed id types, can't split by range
+            ids = []
+        step = len(ids) / shards
+        bounds.extend(sorted(set(ids[int(step * i)] for i in range(1, shards) if int(step * i) < len(ids))))
+    bounds.append(None)
+    return bounds
+
+
+def _get_query(since=None):
+    """Get mongo query for items updated since given time.
+
+    Query is not stored in checkpoint, mongo doesn't allow ``$`` prefixed keys in documents.
+    """
+    if since:
+        return {'versioncreated': {'$gte': since}}
+    return {}
+
+
+def _get_shard_query(checkpoint, shard):
+    query = _get_query(checkpoint.get('since'))
+    id_query = {}
+    if shard.get('last_id') is not None:
+        id_query['$gt'] = shard['last_id']
+    elif shard.get('start') is not None:
+        id_query['$gte'] = shard['start']
+    if shard.get('end') is not None:
+        id_query['$lt'] = shard['end']
+    if id_query:
+        query[config.ID_FIELD] = id_query
+    return query
+
+
+def _index_shard(current_app, resource, checkpoint, shard, batch_size):
+    with current_app.app_context():
+        count = 0
+        for items in _get_mongo_items(resource, _get_shard_query(checkpoint, shard), batch_size):
+            started = time.time()
+            _bulk_insert(resource, items)
+            count += len(items)
+            get_checkpoints_collection().update_one(
+                {'_id': resource},
+                {'$set': {'shards.{}.last_id'.format(shard['index']): items[-1][config.ID_FIELD]}}
+            )
+            duration = time.time() - started
+            print('{} Shard {} inserted {} items in {:.3f} seconds ({:.1f} docs/sec)'.format(
+                time.strftime('%X %x %Z'), shard['index'], len(items), duration,
+                len(items) / duration if duration else len(items)))
+
+        get_checkpoints_collection().update_one(
+            {'_id': resource},
+            {'$set': {'shards.{}.done'.format(shard['index']): True}}
+        )
+        return count
+
+
+def _bulk_insert(resource, items):
+    """Bulk insert items without refreshing the index, retrying on errors."""
+    elastic = superdesk.app.data._search_backend(resource)
+    parent_type = elastic._get_parent_type(resource)
+    if parent_type:
+        for item in items:
+            if item.get(parent_type.get('field')):
+                item['_parent'] = item.get(parent_type.get('field'))
+
+    for i in range(1, bulk_retries + 1):
+        try:
+            success, failed = bulk(elastic.elastic(resource), items, stats_only=False, raise_on_error=False,
+                                   **elastic._es_args(resource))
+        except Exception as ex:
+            if i == bulk_retries:
+                raise
+            print('Exception thrown on insert to elastic {}'.format(ex))
+            time.sleep(2 ** i)
+            continue
+        else:
+            break
 
-        for items in _get_mongo_items(resource, hours):
-            print('{} Inserting {} items'.format(time.strftime('%X %x %Z'), len(items)))
-            s = time.time()
-
-            for i in range(1, 4):
-                try:
-                    success, failed = superdesk.app.data._search_backend(resource).bulk_insert(resource, items)
-                except Exception as ex:
-                    print('Exception thrown on insert to elastic {}', ex)
-                    time.sleep(10)
-                    continue
-                else:
-                    break
-
-            print('{} Inserted {} items in {:.3f} seconds'.format(time.strftime('%X %x %Z'), success, time.time() - s))
-            if failed:
-                print('Failed to do bulk insert of items {}. Errors: {}'.format(len(failed), failed))
-                raise BulkIndexError(resource=resource, errors=failed)
-
-        print('Finished indexing collection {}'.format(resource))
+    if failed:
+        print('Failed to do bulk insert of items {}. Errors: {}'.format(len(failed), failed))
+        raise BulkIndexError(resource=resource, errors=failed)
+    return success
 
 
-def _get_mongo_items(mongo_collection_name, hours=None):
-    """Generate list of items from given mongo collection per default page size.
+def _get_mongo_items(mongo_collection_name, query, batch_size=default_page_size):
+    """Generate list of items from given mongo collection using single sorted cursor.
 
     :param mongo_collection_name: Name of the collection to get the items
+    :param query: mongo query
+    :param batch_size: number of items to return in every list
     :return: list of items
     """
-    print('Indexing data from mongo/{} to elastic/{} for hours={}'.format(mongo_collection_name,
-                                                                          mongo_collection_name,
-                                                                          hours))
-
     db = app.data.get_mongo_collection(mongo_collection_name)
-    args = {'limit': default_page_size, 'sort': [(config.ID_FIELD, pymongo.ASCENDING)]}
-    if hours:
-        now = utcnow() - timedelta(hours=float(hours))
-        args['filter'] = {'versioncreated': {'$gte': now}}
-    else:
-        now = utcnow()
-        args['filter'] = {}
-
-    last_id = None
-    while True:
-        if last_id:
-            args['filter'].update({config.ID_FIELD: {'$gt': last_id}})
-        cursor = db.find(**args)
-        if not cursor.count():
-            break
-        items = list(cursor)
-        last_id = items[-1][config.ID_FIELD]
-        yield items
+    cursor = db.find(query, sort=[(config.ID_FIELD, pymongo.ASCENDING)], batch_size=batch_size,
+                     no_cursor_timeout=True)
+    try:
+        items = []
+        for item in cursor:
+            items.append(item)
+            if len(items) >= batch_size:
+                yield items
+                items = []
+        if items:
+            yield items
+    finally:
+        cursor.close()
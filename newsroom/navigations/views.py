@@ -7,8 +7,10 @@ from flask_babel import gettext
 from superdesk import get_resource_service
 
 from newsroom.auth.decorator import admin_only
+from newsroom.cache import invalidate_cache
 from newsroom.navigations import blueprint
 from newsroom.products.products import get_products_by_navigation
+from newsroom.topics import percolator
 from newsroom.utils import get_json_or_400, get_entity_or_404, get_file, query_resource
 
 
@@ -90,6 +92,8 @@ def delete(_id):
     products = get_products_by_navigation(_id)
     for product in products:
         db.update_one({'_id': product['_id']}, {'$pull': {'navigations': _id}})
+    invalidate_cache('products')
+    percolator.sync_topics_async()
 
     get_resource_service('navigations').delete({'_id': ObjectId(_id)})
     return jsonify({'success': True}), 200
@@ -108,5 +112,7 @@ def save_navigation_products(_id):
             db.update_one({'_id': product['_id']}, {'$addToSet': {'navigations': _id}})
         else:
             db.update_one({'_id': product['_id']}, {'$pull': {'navigations': _id}})
+    invalidate_cache('products')
+    percolator.sync_topics_async()
 
     return jsonify(), 200
@@ -0,0 +1,76 @@
+import logging
+import superdesk
+
+from newsroom.email import pooled_emails
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """Collect notifications for an item and send them at once.
+
+    Each user gets a single email of every notification type per item,
+    notification type is given by the function sending the email.
+    Notifications are stored using single bulk write and emails are sent using pooled
+    connections when leaving the context.
+
+    Usage::
+
+        with NotificationDispatcher(item['_id']) as dispatcher:
+            dispatcher.add_users(user_ids)
+            dispatcher.add_email(user, send_email_function, user, item=item)
+    """
+
+    def __init__(self, item_id):
+        self.item_id = item_id
+        self.users = []
+        self._user_ids = set()
+        self.emailed = set()
+        self._emails = None
+
+    def __enter__(self):
+        self._emails = pooled_emails()
+        self._emails.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        emails, self._emails = self._emails, None
+        try:
+            if exc_type is None:
+                self.save()
+        finally:
+            emails.__exit__(exc_type, exc_value, traceback)
+
+    def add_users(self, user_ids):
+        """Add users who should get notification stored for the item.
+
+        :param user_ids: list of user ids
+        """
+        for user_id in user_ids:
+            if user_id not in self._user_ids:
+                self._user_ids.add(user_id)
+                self.users.append(user_id)
+
+    def add_email(self, user, send, *args, **kwargs):
+        """Send email to user unless there was one of the same type sent already for the item.
+
+        :param user: user dict
+        :param send: function rendering and sending the email
+        :return: ``True`` if email was sent
+        """
+        if not user or (send, user['_id']) in self.emailed:
+            return False
+        self.emailed.add((send, user['_id']))
+        send(*args, **kwargs)
+        return True
+
+    def save(self):
+        """Store notifications for all users added."""
+        if self.users:
+            superdesk.get_resource_service('notifications').create([
+                {'item': self.item_id, 'user': user_id}
+                for user_id in self.users
+            ])
+            logger.debug('Stored %d notifications for item %s', len(self.users), self.item_id)
+            self.users = []
+            self._user_ids = set()
@@ -2,13 +2,14 @@
 import datetime
 import newsroom
 import superdesk
-import pymongo.errors
-import werkzeug.exceptions
 
 from bson import ObjectId
+from pymongo import UpdateOne
 from superdesk.utc import utcnow
 from flask import current_app as app, session
 
+from newsroom.cache import get_cache_version, invalidate_cache
+
 
 class NotificationsResource(newsroom.Resource):
     url = 'users/<regex("[a-f0-9]{24}"):user>/notifications'
@@ -32,20 +33,48 @@ class NotificationsResource(newsroom.Resource):
     }
 
 
+#: item fields used for notifications rendering
+NOTIFICATION_ITEM_FIELDS = ('_id', 'type', 'headline', 'name', 'versioncreated')
+
+
 class NotificationsService(newsroom.Service):
-    def create(self, docs):
+    def create(self, docs, **kwargs):
+        """Upsert notifications using single bulk write.
+
+        There is a single notification per user and item, existing ones only get ``created`` time updated.
+
+        :param docs: list of notifications
+        """
         now = utcnow()
+        ids = []
+        seen = set()
+        requests = []
 
         for doc in docs:
             id = '_'.join(map(str, [doc['user'], doc['item']]))
-            try:
-                super().create([{
-                    '_id': id,
-                    'created': now, 'user': ObjectId(doc['user']), 'item': doc['item']
-                }])
-            except (werkzeug.exceptions.Conflict, pymongo.errors.BulkWriteError):
-                original = super().find_one(req=None, _id=id)
-                super().update(id=id, updates={'created': now}, original=original)
+            if id in seen:
+                continue
+            seen.add(id)
+            ids.append(id)
+            requests.append(UpdateOne({'_id': id}, {
+                '$set': {'created': now, '_updated': now},
+                '$setOnInsert': {'user': ObjectId(doc['user']), 'item': doc['item'], '_created': now},
+            }, upsert=True))
+
+        if requests:
+            app.data.get_mongo_collection('notifications').bulk_write(requests, ordered=False)
+
+        for user_id in set(str(doc['user']) for doc in docs):
+            invalidate_summary(user_id)
+        return ids
+
+    def delete(self, lookup):
+        res = super().delete(lookup)
+        if lookup.get('_id'):
+            invalidate_summary(lookup['_id'].split('_', 1)[0])
+        elif lookup.get('user'):
+            invalidate_summary(lookup['user'])
+        return res
 
 
 def get_user_notifications(user_id):
@@ -58,6 +87,52 @@ def get_user_notifications(user_id):
     return list(superdesk.get_resource_service('notifications').get(req=None, lookup=lookup))
 
 
+def get_summary_key(user_id):
+    return 'notifications-summary:{}:{}'.format(user_id, get_cache_version('notifications', str(user_id)))
+
+
+def invalidate_summary(user_id):
+    """Invalidate cached notifications summary for user.
+
+    Summary is versioned, so summary built from data read before invalidation is never used.
+    """
+    invalidate_cache('notifications', str(user_id))
+
+
+def get_summary_item(item):
+    return {field: item[field] for field in NOTIFICATION_ITEM_FIELDS if field in item}
+
+
+def get_notifications_summary(user_id):
+    """Get notified items for user using cached summary.
+
+    Summary is built using notifications and items search and cached until
+    notifications of user are created or deleted.
+
+    :param user_id: user id
+    """
+    key = get_summary_key(user_id)
+    notifications = app.cache.get(key)
+    if notifications is None:
+        saved_notifications = get_user_notifications(user_id)
+        created = {n['item']: n['created'] for n in saved_notifications}
+        items = []
+        try:
+            items.extend(superdesk.get_resource_service('wire_search').get_items(list(created.keys())))
+        except KeyError:  # wire disabled
+            pass
+        try:
+            items.extend(superdesk.get_resource_service('agenda').get_items(list(created.keys())))
+        except KeyError:  # agenda disabled
+            pass
+        notifications = sorted([{'created': created[item['_id']], 'item': get_summary_item(item)} for item in items],
+                               key=lambda n: n['created'])
+        app.cache.set(key, notifications, timeout=app.config['NOTIFICATIONS_SUMMARY_TIMEOUT'])
+
+    since = utcnow() - datetime.timedelta(days=app.config.get('NOTIFICATIONS_TTL', 1))
+    return [n['item'] for n in notifications if n['created'] >= since]
+
+
 def get_initial_notifications():
     """
     Returns the stories that user has notifications for
@@ -66,18 +141,7 @@ def get_initial_notifications():
     if not session.get('user'):
         return None
 
-    saved_notifications = get_user_notifications(session['user'])
-    item_ids = [n['item'] for n in saved_notifications]
-    items = []
-    try:
-        items.extend(superdesk.get_resource_service('wire_search').get_items(item_ids))
-    except KeyError:  # wire disabled
-        pass
-    try:
-        items.extend(superdesk.get_resource_service('agenda').get_items(item_ids))
-    except KeyError:  # agenda disabled
-        pass
     return {
         'user': str(session['user']) if session['user'] else None,
-        'notifications': list(items),
+        'notifications': get_notifications_summary(session['user']),
     }
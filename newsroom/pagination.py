@@ -0,0 +1,92 @@
+"""Cursor based pagination for search results.
+
+Elastic 2.x has no ``search_after``, so the next page is filtered using range
+on the sort field starting at the last item of the previous page. Items with
+the same sort value as the last item which were returned already are excluded
+using their ids, so deep pages cost the same as the first one.
+"""
+
+from datetime import datetime
+from flask import current_app as app
+from itsdangerous import URLSafeSerializer, BadSignature
+from eve_elastic.elastic import parse_date
+from superdesk.utc import utc
+
+CURSOR_SALT = 'search-cursor'
+
+
+def _get_serializer():
+    return URLSafeSerializer(app.config['SECRET_KEY'], salt=CURSOR_SALT)
+
+
+def _get_value(item, field):
+    value = item
+    for key in field.split('.'):
+        value = value.get(key) if isinstance(value, dict) else None
+    if isinstance(value, str):
+        value = parse_date(value)  # nested dates are not parsed by elastic backend
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=utc)
+        return int(value.timestamp() * 1000)
+    return None
+
+
+def load_cursor(token):
+    """Get cursor data from token.
+
+    :param token: cursor token
+    :return: dict with ``field``, ``value`` and ``ids`` or ``None`` if token is not valid
+    """
+    try:
+        return _get_serializer().loads(token)
+    except BadSignature:
+        return None
+
+
+def get_next_cursor(items, field, token=None):
+    """Get cursor token for the page following given items.
+
+    :param items: items of the current page
+    :param field: date field used for sorting
+    :param token: cursor token used to get current page
+    :return: cursor token or ``None`` if there are no more items
+    """
+    value = _get_value(items[-1], field) if items else None
+    if value is None:
+        return None
+
+    ids = [item['_id'] for item in items if _get_value(item, field) == value]
+    cursor = load_cursor(token) if token else None
+    if cursor and cursor['field'] == field and cursor['value'] == value:
+        ids = cursor['ids'] + ids
+
+    return _get_serializer().dumps({'field': field, 'value': value, 'ids': ids})
+
+
+def get_cursor_query(token, field, order):
+    """Get query matching items after the cursor.
+
+    :param token: cursor token
+    :param field: date field used for sorting
+    :param order: sort order, either ``asc`` or ``desc``
+    :return: query or ``None`` if token is not valid
+    """
+    cursor = load_cursor(token)
+    if not cursor or cursor['field'] != field:
+        return None
+
+    value = cursor['value']
+    return {
+        'bool': {
+            'should': [
+                {'range': {field: {'gt' if order == 'asc' else 'lt': value, 'format': 'epoch_millis'}}},
+                {
+                    'bool': {
+                        'must': {'range': {field: {'gte': value, 'lte': value, 'format': 'epoch_millis'}}},
+                        'must_not': {'ids': {'values': cursor['ids']}},
+                    },
+                },
+            ],
+        },
+    }
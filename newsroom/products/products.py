@@ -1,6 +1,9 @@
 import newsroom
 import superdesk
 
+from newsroom.cache import CachedResourceServiceMixin, get_cached
+from newsroom.topics.percolator import PercolatorSyncServiceMixin
+
 
 class ProductsResource(newsroom.Resource):
     """
@@ -50,14 +53,31 @@ class ProductsResource(newsroom.Resource):
     query_objectid_as_string = True  # needed for companies/navigations lookup to work
 
 
-class ProductsService(newsroom.Service):
+class ProductsService(PercolatorSyncServiceMixin, CachedResourceServiceMixin, newsroom.Service):
     pass
 
 
 def get_products_by_navigation(navigation_id):
-    return list(superdesk.get_resource_service('products').
-                get(req=None, lookup={'navigations': str(navigation_id),
-                                      'is_enabled': True}))
+    return get_cached('products', 'navigation:{}'.format(navigation_id), lambda: list(
+        superdesk.get_resource_service('products').get(req=None, lookup={
+            'navigations': str(navigation_id),
+            'is_enabled': True,
+        })))
+
+
+def get_products_by_navigations(navigation_ids):
+    """Get enabled products for multiple navigations using single query.
+
+    :param navigation_ids: list of navigation ids
+    :return: dict of products lists by navigation id
+    """
+    ids = sorted(set(str(_id) for _id in navigation_ids))
+    products = get_cached('products', 'navigations:{}'.format(','.join(ids)), lambda: list(
+        superdesk.get_resource_service('products').get(req=None, lookup={
+            'navigations': {'$in': ids},
+            'is_enabled': True,
+        })))
+    return {_id: [product for product in products if _id in product.get('navigations', [])] for _id in ids}
 
 
 def get_products_by_company(company_id, navigation_id=None, product_type=None):
@@ -73,8 +93,9 @@ def get_products_by_company(company_id, navigation_id=None, product_type=None):
     if product_type:
         lookup['product_type'] = product_type
 
-    products = list(superdesk.get_resource_service('products').get(req=None, lookup=lookup))
-    return products
+    key = 'company:{}:{}:{}'.format(company_id, navigation_id, product_type)
+    return get_cached('products', key, lambda: list(
+        superdesk.get_resource_service('products').get(req=None, lookup=lookup)))
 
 
 def get_products_dict_by_company(company_id):
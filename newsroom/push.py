@@ -1,8 +1,10 @@
 import hmac
 import flask
 import logging
+import pymongo
 import superdesk
-from datetime import datetime
+from pymongo import UpdateOne
+from datetime import datetime, timedelta
 
 from copy import copy, deepcopy
 from flask import current_app as app
@@ -10,13 +12,19 @@ from flask_babel import gettext
 from superdesk.text_utils import get_word_count, get_char_count
 
 from superdesk.utc import utcnow
+from superdesk.lock import lock, unlock
+from eve.methods.common import resolve_document_etag
+from newsroom.celery_app import celery
 from newsroom.notifications import push_notification
+from newsroom.notifications.dispatcher import NotificationDispatcher
+from newsroom.media_utils import set_placeholder_renditions, generate_item_renditions
+from newsroom.topics import percolator
 from newsroom.topics.topics import get_wire_notification_topics, get_agenda_notification_topics
 from newsroom.utils import parse_dates, get_user_dict, get_company_dict, parse_date_str
 from newsroom.email import send_new_item_notification_email, \
     send_history_match_notification_email, send_item_killed_notification_email
 from newsroom.history import get_history_users
-from newsroom.wire.views import HOME_ITEMS_CACHE_KEY
+from newsroom.wire.dashboard import invalidate_cards
 from newsroom.wire import url_for_wire
 from newsroom.upload import ASSETS_RESOURCE
 from newsroom.signals import publish_item as publish_item_signal
@@ -29,6 +37,11 @@ blueprint = flask.Blueprint('push', __name__)
 
 KEY = 'PUSH_KEY'
 
+PUSH_TYPES = ['event', 'planning', 'text', 'planning_featured']
+PUSH_QUEUE_PENDING = 'pending'
+PUSH_QUEUE_PROCESSING = 'processing'
+PUSH_QUEUE_FAILED = 'failed'
+
 
 def test_signature(request):
     """Test if request is signed using app PUSH_KEY."""
@@ -66,6 +79,20 @@ def push():
     assert 'guid' in item or '_id' in item, {'guid': 1}
     assert 'type' in item, {'type': 1}
 
+    if item.get('type') not in PUSH_TYPES:
+        flask.abort(400, gettext('Unknown type {}'.format(item.get('type'))))
+
+    if app.config.get('PUSH_QUEUE_ENABLED'):
+        queue_id = enqueue_push(item, flask.request.get_data(as_text=True))
+        process_push_queue.delay(queue_id)
+        return flask.jsonify({'_id': str(queue_id)}), 202
+
+    process_push(item)
+    return flask.jsonify({})
+
+
+def process_push(item):
+    """Store pushed item and send notifications for it."""
     if item.get('type') == 'event':
         orig = app.data.find_one('agenda', req=None, _id=item['guid'])
         id = publish_event(item, orig)
@@ -83,13 +110,142 @@ def push():
         orig = app.data.find_one('wire_search', req=None, _id=item['guid'])
         item['_id'] = publish_item(item, is_new=orig is None)
         notify_new_item(item, check_topics=orig is None)
+        invalidate_cards(item)
     elif item['type'] == 'planning_featured':
         publish_planning_featured(item)
-    else:
-        flask.abort(400, gettext('Unknown type {}'.format(item.get('type'))))
 
-    app.cache.delete(HOME_ITEMS_CACHE_KEY)
-    return flask.jsonify({})
+
+def get_push_queue_collection():
+    collection = app.data.pymongo('items').db.push_queue
+    if not app.extensions.get('push_queue_indexes'):
+        collection.create_index([('guid', pymongo.ASCENDING), ('status', pymongo.ASCENDING),
+                                 ('created', pymongo.ASCENDING)])
+        collection.create_index([('status', pymongo.ASCENDING), ('started', pymongo.ASCENDING)])
+        app.extensions['push_queue_indexes'] = True
+    return collection
+
+
+def enqueue_push(item, payload):
+    """Persist raw push payload so it can be processed by celery workers.
+
+    :param item: parsed item, used to get the guid for ordering
+    :param payload: raw request data
+    :return: queue entry _id
+    """
+    return get_push_queue_collection().insert_one({
+        'guid': item.get('guid', item.get('_id')),
+        'type': item['type'],
+        'payload': payload,
+        'status': PUSH_QUEUE_PENDING,
+        'created': utcnow(),
+    }).inserted_id
+
+
+def get_expired_lease():
+    """Get time before which processing entries are considered abandoned by crashed worker."""
+    return utcnow() - timedelta(seconds=app.config['PUSH_QUEUE_LEASE_TIMEOUT'])
+
+
+def get_next_push(collection, guid):
+    """Get the oldest entry for guid if it can be processed now.
+
+    Entry which is being processed by other worker or which failed blocks later
+    entries for the same guid, so pushes are never applied out of order.
+
+    :return: entry or ``None`` if there is no entry or the oldest one is blocking
+    """
+    entry = collection.find_one({'guid': guid}, sort=[('created', pymongo.ASCENDING), ('_id', pymongo.ASCENDING)])
+    if not entry:
+        return None
+    if entry['status'] == PUSH_QUEUE_FAILED:
+        logger.warning('push processing for %s is blocked by failed push %s', guid, entry['_id'])
+        return None
+    if entry['status'] == PUSH_QUEUE_PROCESSING and entry.get('started') and entry['started'] >= get_expired_lease():
+        return None
+    return entry
+
+
+@celery.task(bind=True, soft_time_limit=600, max_retries=None)
+def process_push_queue(self, queue_id):
+    """Process all pending pushes for the guid of given queue entry.
+
+    Entries for the same guid are processed in the order they were received,
+    a lock per guid makes sure there is only one worker doing it at a time.
+    A failed entry stops processing of later entries for the guid until it's requeued.
+    """
+    collection = get_push_queue_collection()
+    entry = collection.find_one({'_id': queue_id})
+    if not entry:
+        return  # already processed
+
+    guid = entry['guid']
+    lock_name = 'push:{}'.format(guid)
+    # lock must not expire before processing lease, other worker would skip the leased entry otherwise
+    if not lock(lock_name, expire=max(610, app.config['PUSH_QUEUE_LEASE_TIMEOUT'])):
+        raise self.retry(countdown=app.config.get('PUSH_QUEUE_RETRY_COUNTDOWN', 2))
+
+    try:
+        while True:
+            entry = get_next_push(collection, guid)
+            if not entry:
+                break
+
+            entry = collection.find_one_and_update(
+                {'_id': entry['_id'], 'status': entry['status']},
+                {'$set': {'status': PUSH_QUEUE_PROCESSING, 'started': utcnow()}},
+            )
+            if not entry:
+                continue  # taken by other worker
+
+            try:
+                process_push(flask.json.loads(entry['payload']))
+            except Exception as err:
+                logger.exception('push processing failed for %s', guid)
+                collection.update_one({'_id': entry['_id']}, {'$set': {
+                    'status': PUSH_QUEUE_FAILED,
+                    'error': str(err),
+                }})
+                break
+            else:
+                collection.delete_one({'_id': entry['_id']})
+    finally:
+        unlock(lock_name)
+
+
+def requeue_pushes(status=PUSH_QUEUE_PENDING):
+    """Send push queue entries with given status to workers again.
+
+    Used to recover pushes which were not processed, eg. when workers were not running.
+    Processing entries are requeued only if their lease expired, others might be still running.
+    """
+    collection = get_push_queue_collection()
+    lookup = {'status': status}
+    if status == PUSH_QUEUE_PROCESSING:
+        lookup['started'] = {'$lt': get_expired_lease()}
+    entries = collection.find(lookup, sort=[('created', pymongo.ASCENDING)])
+    guids = set()
+    for entry in entries:
+        if status != PUSH_QUEUE_PENDING:
+            collection.update_one({'_id': entry['_id']}, {'$set': {'status': PUSH_QUEUE_PENDING}})
+        if entry['guid'] not in guids:
+            guids.add(entry['guid'])
+            process_push_queue.delay(entry['_id'])
+    return len(guids)
+
+
+@celery.task(soft_time_limit=120)
+def requeue_expired_pushes():
+    """Send entries abandoned in processing state by crashed workers to workers again."""
+    collection = get_push_queue_collection()
+    entries = collection.find({'status': PUSH_QUEUE_PROCESSING, 'started': {'$lt': get_expired_lease()}},
+                              sort=[('created', pymongo.ASCENDING)])
+    guids = set()
+    for entry in entries:
+        if entry['guid'] not in guids:
+            guids.add(entry['guid'])
+            process_push_queue.delay(entry['_id'])
+    if guids:
+        logger.warning('requeued expired pushes for %d items', len(guids))
 
 
 def set_dates(doc):
@@ -123,8 +279,12 @@ def publish_item(doc, is_new):
     for assoc in doc.get('associations', {}).values():
         if assoc:
             assoc.setdefault('subscribers', [])
+    generate_renditions_async = False
     if doc.get('associations', {}).get('featuremedia'):
-        app.generate_renditions(doc)
+        if app.config.get('RENDITIONS_ASYNC'):
+            generate_renditions_async = set_placeholder_renditions(doc)
+        else:
+            app.generate_renditions(doc)
     if doc.get('coverage_id'):
         agenda_items = superdesk.get_resource_service('agenda').set_delivery(doc)
         if agenda_items:
@@ -133,6 +293,8 @@ def publish_item(doc, is_new):
     _id = service.create([doc])[0]
     if 'evolvedfrom' in doc and parent_item:
         service.system_update(parent_item['_id'], {'nextversion': _id}, parent_item)
+    if generate_renditions_async:
+        generate_item_renditions.delay(_id)
     return _id
 
 
@@ -231,24 +393,28 @@ def publish_planning(planning):
         # this is a planning for an event item
         # if there's an event then _id field will have the same value as event_id
         agenda = app.data.find_one('agenda', req=None, guid=planning['event_item'])
+        original = deepcopy(agenda)
 
         if not agenda:
             # event id exists in planning item but event is not in the system
             logger.warning('Event {} for planning {} couldn\'t be found'.format(planning['event_item'], planning))
             # create new agenda
-            agenda = init_adhoc_agenda(planning)
+            # check if there's an existing ad-hoc
+            original = app.data.find_one('agenda', req=None, _id=planning['guid']) or {}
+            agenda = init_adhoc_agenda(planning, deepcopy(original))
         else:
             if planning.get('state') in [WORKFLOW_STATE.CANCELLED, WORKFLOW_STATE.KILLED] or \
                     planning.get('pubstatus') == 'cancelled':
                 # remove the planning item from the list
                 set_agenda_planning_items(agenda, planning, action='remove')
 
-                service.patch(agenda['_id'], agenda)
+                update_agenda(agenda, original)
                 return agenda
 
     else:
-        # there's no event item (ad-hoc planning item)
-        agenda = init_adhoc_agenda(planning)
+        # there's no event item (ad-hoc planning item), check if there's an existing one
+        original = app.data.find_one('agenda', req=None, _id=planning['guid']) or {}
+        agenda = init_adhoc_agenda(planning, deepcopy(original))
 
     # update agenda metadata
     new_plan = set_agenda_metadata_from_planning(agenda, planning)
@@ -262,18 +428,77 @@ def publish_planning(planning):
         agenda.setdefault('guid', planning.get('event_item', planning['guid']) or planning['guid'])
         service.post([agenda])[0]
     else:
-        # replace the original document
-        service.patch(agenda['_id'], agenda)
+        update_agenda(agenda, original)
     return agenda
 
 
-def init_adhoc_agenda(planning):
+#: agenda lists with entries identified by given field
+AGENDA_LISTS = {'planning_items': 'guid', 'coverages': 'coverage_id'}
+
+
+def get_agenda_updates(agenda, original):
+    """Get changed fields of agenda and mongo operations storing these.
+
+    Planning items and coverages are stored per changed entry using positional operator
+    as long as no entry was added, removed or reordered, otherwise whole list is set.
+
+    :param agenda: updated agenda
+    :param original: agenda before changes
+    :return: tuple of updates and list of mongo operations, updates are empty if nothing changed
     """
-    Inits an adhoc agenda item
+    updates = {key: value for key, value in agenda.items()
+               if not key.startswith('_') and value != original.get(key)}
+    if not updates:
+        return {}, []
+
+    updates[app.config['LAST_UPDATED']] = utcnow()
+    updated = copy(original)
+    updated.update(updates)
+    updated.pop(app.config['ETAG'], None)
+    resolve_document_etag(updated, 'agenda')
+    updates[app.config['ETAG']] = updated[app.config['ETAG']]
+
+    fields = {}
+    operations = []
+    for key, value in updates.items():
+        id_field = AGENDA_LISTS.get(key)
+        ids = [entry.get(id_field) for entry in value or []] if id_field else None
+        if ids and len(set(ids)) == len(ids) and ids == [entry.get(id_field) for entry in original.get(key) or []]:
+            for entry, original_entry in zip(value, original[key]):
+                if entry != original_entry:
+                    operations.append(UpdateOne({'_id': agenda['_id'], '%s.%s' % (key, id_field): entry[id_field]},
+                                                {'$set': {'%s.$' % key: entry}}))
+        else:
+            fields[key] = value
+    operations.insert(0, UpdateOne({'_id': agenda['_id']}, {'$set': fields}))
+    return updates, operations
+
+
+def update_agenda(agenda, original):
+    """Store only fields of agenda which were changed.
+
+    Changes are written to mongo using :func:`get_agenda_updates` and only changed
+    fields are sent to elastic as partial update, so the document is not fetched again.
+
+    :param agenda: updated agenda
+    :param original: agenda before changes
     """
+    updates, operations = get_agenda_updates(agenda, original)
+    if not updates:
+        return
 
-    # check if there's an existing ad-hoc
-    agenda = app.data.find_one('agenda', req=None, _id=planning['guid']) or {}
+    app.data.get_mongo_collection('agenda').bulk_write(operations)
+    app.data._search_backend('agenda').update('agenda', agenda['_id'], copy(updates))
+    agenda.update(updates)
+
+
+def init_adhoc_agenda(planning, agenda):
+    """
+    Inits an adhoc agenda item
+
+    :param planning: planning item
+    :param agenda: existing ad-hoc agenda or empty dict
+    """
 
     # planning dates is saved as the dates of the new agenda
     agenda['dates'] = {
@@ -395,11 +620,11 @@ def set_agenda_planning_items(agenda, planning_item, action='add'):
         superdesk.get_resource_service('agenda').notify_agenda_update('planning_added', agenda, True)
 
     if action == 'remove':
-        existing_planning_items = deepcopy(agenda.get('planning_items', []))
-        agenda['planning_items'] = [p for p in existing_planning_items if p['guid'] != planning_item['guid']] or []
+        agenda['planning_items'] = [p for p in agenda.get('planning_items') or [] if p['guid'] != planning_item['guid']]
         superdesk.get_resource_service('agenda').notify_agenda_update('planning_cancelled', agenda, True)
 
-    agenda['coverages'], coverage_changes = get_coverages(agenda['planning_items'], (agenda.get('coverages') or []))
+    agenda['coverages'], coverage_changes = get_coverages(agenda['planning_items'], (agenda.get('coverages') or []),
+                                                          planning_item['guid'])
 
     if coverage_changes.get('coverage_added'):
         superdesk.get_resource_service('agenda').notify_agenda_update('coverage_added', agenda, True)
@@ -430,13 +655,20 @@ def get_display_dates(agenda_date, planning_items):
     return display_dates
 
 
-def get_coverages(planning_items, original_coverages=[]):
+def get_coverages(planning_items, original_coverages=[], planning_id=None):
     """
     Returns list of coverages for given planning items
+
+    If ``planning_id`` is set, only coverages of that planning item are created again,
+    original coverages are used for other planning items.
     """
+    original_by_id = {c['coverage_id']: c for c in original_coverages}
+    original_by_planning = {}
+    for c in original_coverages:
+        original_by_planning.setdefault(c.get('planning_id'), []).append(c)
 
     def get_existing_coverage(id):
-        return next((o for o in original_coverages if o['coverage_id'] == id), {})
+        return original_by_id.get(id, {})
 
     def set_delivery(coverage, deliveries):
         cov_deliveries = []
@@ -469,6 +701,12 @@ def get_coverages(planning_items, original_coverages=[]):
     coverages = []
     coverage_changes = {}
     for planning_item in planning_items:
+        if planning_id and planning_item['guid'] != planning_id and \
+                set(c['coverage_id'] for c in original_by_planning.get(planning_item['guid'], [])) == \
+                set(c['coverage_id'] for c in planning_item.get('coverages') or []):
+            coverages.extend(original_by_planning.get(planning_item['guid'], []))
+            continue
+
         for coverage in planning_item.get('coverages') or []:
             existing_coverage = get_existing_coverage(coverage['coverage_id'])
             new_coverage = {
@@ -503,16 +741,17 @@ def notify_new_item(item, check_topics=True):
 
     push_notification('new_item', _items=[item])
 
-    if check_topics:
-        if item.get('type') == 'text':
-            notify_wire_topic_matches(item, user_dict, company_dict)
-        else:
-            notify_agenda_topic_matches(item, user_dict)
+    with NotificationDispatcher(item['_id']) as dispatcher:
+        if check_topics:
+            if item.get('type') == 'text':
+                notify_wire_topic_matches(item, user_dict, company_dict, dispatcher)
+            else:
+                notify_agenda_topic_matches(item, user_dict, dispatcher)
 
-    notify_user_matches(item, user_dict, company_dict, user_ids, company_ids)
+        notify_user_matches(item, user_dict, company_dict, user_ids, company_ids, dispatcher)
 
 
-def notify_user_matches(item, users_dict, companies_dict, user_ids, company_ids):
+def notify_user_matches(item, users_dict, companies_dict, user_ids, company_ids, dispatcher):
     """Send notification to users who have downloaded or bookmarked the provided item"""
 
     related_items = item.get('ancestors', [])
@@ -560,10 +799,7 @@ def notify_user_matches(item, users_dict, companies_dict, user_ids, company_ids)
         if not users_ids:
             return
 
-        app.data.insert('notifications', [
-            {'item': item['_id'], 'user': user}
-            for user in users_ids
-        ])
+        dispatcher.add_users(users_ids)
 
         push_notification(
             'history_matches',
@@ -575,7 +811,8 @@ def notify_user_matches(item, users_dict, companies_dict, user_ids, company_ids)
             item,
             users_ids,
             users_dict,
-            section
+            section,
+            dispatcher
         )
 
     # First add users for the 'wire' section and send the notification
@@ -589,30 +826,33 @@ def notify_user_matches(item, users_dict, companies_dict, user_ids, company_ids)
         _send_notification(section_id, _get_users(section_id))
 
 
-def send_user_notification_emails(item, user_matches, users, section):
+def send_user_notification_emails(item, user_matches, users, section, dispatcher):
     for user_id in user_matches:
         user = users.get(str(user_id))
         if item.get('pubstatus', item.get('state')) in ['canceled', 'cancelled']:
-            send_item_killed_notification_email(user, item=item)
+            dispatcher.add_email(user, send_item_killed_notification_email, user, item=item)
         else:
             if user.get('receive_email'):
-                send_history_match_notification_email(user, item=item, section=section)
+                dispatcher.add_email(user, send_history_match_notification_email, user, item=item, section=section)
 
 
-def notify_wire_topic_matches(item, users_dict, companies_dict):
-    topics = get_wire_notification_topics()
-
-    topic_matches = superdesk.get_resource_service('wire_search'). \
-        get_matching_topics(item['_id'], topics, users_dict, companies_dict)
+def notify_wire_topic_matches(item, users_dict, companies_dict, dispatcher):
+    if percolator.is_percolator_enabled():
+        topics = percolator.get_matching_topics(item, users_dict, companies_dict)
+        topic_matches = [t['_id'] for t in topics]
+    else:
+        topics = get_wire_notification_topics()
+        topic_matches = superdesk.get_resource_service('wire_search'). \
+            get_matching_topics(item['_id'], topics, users_dict, companies_dict)
 
     if topic_matches:
         push_notification('topic_matches',
                           item=item,
                           topics=topic_matches)
-        send_topic_notification_emails(item, topics, topic_matches, users_dict)
+        send_topic_notification_emails(item, topics, topic_matches, users_dict, dispatcher)
 
 
-def notify_agenda_topic_matches(item, users_dict):
+def notify_agenda_topic_matches(item, users_dict, dispatcher):
     topics = get_agenda_notification_topics(item, users_dict)
 
     topic_matches = [t['_id'] for t in topics]
@@ -621,14 +861,16 @@ def notify_agenda_topic_matches(item, users_dict):
         push_notification('topic_matches',
                           item=item,
                           topics=topic_matches)
-        send_topic_notification_emails(item, topics, topic_matches, users_dict)
+        send_topic_notification_emails(item, topics, topic_matches, users_dict, dispatcher)
 
 
-def send_topic_notification_emails(item, topics, topic_matches, users):
+def send_topic_notification_emails(item, topics, topic_matches, users, dispatcher):
     for topic in topics:
         user = users.get(str(topic['user']))
         if topic['_id'] in topic_matches and user and user.get('receive_email'):
-            send_new_item_notification_email(
+            dispatcher.add_email(
+                user,
+                send_new_item_notification_email,
                 user,
                 topic['label'],
                 item=item,
@@ -1,5 +1,6 @@
 import newsroom
 import superdesk
+from newsroom.topics.percolator import PercolatorSyncServiceMixin
 from newsroom.wire.search import query_string
 
 
@@ -40,7 +41,7 @@ class SectionFiltersResource(newsroom.Resource):
     query_objectid_as_string = True  # needed for companies/navigations lookup to work
 
 
-class SectionFiltersService(newsroom.Service):
+class SectionFiltersService(PercolatorSyncServiceMixin, newsroom.Service):
     def get_section_filters(self, filter_type):
         """Get the list of section filter by filter type
 
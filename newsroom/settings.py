@@ -5,6 +5,7 @@ import copy
 import flask
 from flask_babel import gettext
 from newsroom.auth import admin_only
+from newsroom.cache import invalidate_cache
 from newsroom.utils import get_json_or_400
 from newsroom.template_filters import newsroom_config
 
@@ -38,6 +39,7 @@ def update_values():
 
     get_settings_collection().update_one(GENERAL_SETTINGS_LOOKUP, {'$set': {'values': values}}, upsert=True)
     flask.g.settings = None  # reset cache on update
+    invalidate_cache('settings')
     return flask.jsonify(values)
 
 
@@ -6,7 +6,6 @@ import hashlib
 from flask import current_app as app
 from eve.utils import str_to_date
 from flask_babel import format_time, format_date, format_datetime
-from superdesk import get_resource_service
 from superdesk.text_utils import get_text, get_word_count, get_char_count
 from superdesk.utc import utcnow
 from newsroom.auth import get_user
@@ -100,10 +99,8 @@ def section_allowed(nav, sections):
 
 
 def get_company_sidenavs(blueprint=None):
-    user = get_user()
-    company = None
-    if user and user.get('company'):
-        company = get_resource_service('companies').find_one(req=None, _id=user['company'])
+    from newsroom.companies import get_user_company
+    company = get_user_company(get_user())
     navs = sidenavs(blueprint)
     if company and company.get('sections'):
         return [nav for nav in navs if section_allowed(nav, company['sections'])]
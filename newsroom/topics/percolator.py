@@ -0,0 +1,246 @@
+"""Wire topics percolator.
+
+Topics with notifications enabled are stored as percolator queries in the items index,
+so matching a pushed item is a single percolate request which returns only matching topics.
+"""
+
+import logging
+
+import elasticsearch
+import superdesk
+
+from bson import ObjectId
+from flask import current_app as app
+from werkzeug.exceptions import Forbidden
+
+from newsroom.celery_app import celery
+from newsroom.template_filters import is_admin
+
+logger = logging.getLogger(__name__)
+
+PERCOLATOR_TYPE = '.percolator'
+PERCOLATOR_TOPIC_TYPES = ['wire']
+
+
+def is_percolator_enabled():
+    return app.config.get('WIRE_NOTIFICATIONS_PERCOLATOR', False)
+
+
+def _get_elastic():
+    elastic = app.data._search_backend('items')
+    return elastic.elastic('items'), elastic._resource_index('items')
+
+
+def _is_time_limit(query):
+    """Test if query is the relative wire time limit range set by product query.
+
+    Relative dates are resolved when percolator query is registered,
+    and items getting notified are just published, so it's not stored.
+    """
+    versioncreated = query.get('range', {}).get('versioncreated', {})
+    return str(versioncreated.get('gte', '')).startswith('now')
+
+
+def _is_relative_created(topic):
+    """Relative created ranges (eg. ``now/d``) must be resolved when matching."""
+    created = topic.get('created') or {}
+    return any(str(created.get(key) or '').startswith('now') for key in ('from', 'to'))
+
+
+def _get_created_range(topic):
+    from newsroom.wire.search import versioncreated_range
+    return versioncreated_range(dict(
+        created_from=topic['created'].get('from'),
+        created_to=topic['created'].get('to'),
+        timezone_offset=topic.get('timezone_offset', '0')
+    ))
+
+
+def _is_in_created_range(item, topic):
+    versioncreated = item.get('versioncreated')
+    if not versioncreated:
+        return True
+    _range = _get_created_range(topic)['range']['versioncreated']
+    if _range.get('gte') and versioncreated < _range['gte']:
+        return False
+    if _range.get('lte') and versioncreated > _range['lte']:
+        return False
+    return True
+
+
+def get_topic_query(topic, user, company):
+    """Get percolator query for given topic.
+
+    :param topic: topic
+    :param user: topic user
+    :param company: user company
+    :return: query or ``None`` if the user can't get any notification
+    """
+    from newsroom.wire.search import set_product_query, query_string, _filter_terms
+
+    query = {
+        'bool': {
+            'must_not': [
+                {'term': {'type': 'composite'}},
+                {'constant_score': {'filter': {'exists': {'field': 'nextversion'}}}},
+            ],
+            'must': [],
+        }
+    }
+
+    superdesk.get_resource_service('section_filters').apply_section_filter(query, topic.get('topic_type'))
+
+    product_query = {'bool': {'must': [], 'must_not': [], 'should': []}}
+    try:
+        set_product_query(product_query, company, topic.get('topic_type'), user=user)
+    except Forbidden:
+        return
+
+    if product_query['bool']['should']:
+        product_query['bool']['must'] = [q for q in product_query['bool']['must'] if not _is_time_limit(q)]
+        query['bool']['must'].append(product_query)
+
+    if topic.get('query'):
+        query['bool']['must'].append(query_string(topic['query']))
+
+    if topic.get('created') and not _is_relative_created(topic):
+        query['bool']['must'].append(_get_created_range(topic))
+
+    if topic.get('filter'):
+        query['bool']['must'] += _filter_terms(topic['filter'])
+
+    return query
+
+
+def register_topic(topic):
+    """Store topic as percolator query, or remove it if it should not get notifications."""
+    if not topic.get('notifications') or topic.get('topic_type') not in PERCOLATOR_TOPIC_TYPES:
+        unregister_topic(topic)
+        return
+
+    user_id = topic.get('user')
+    if isinstance(user_id, str) and ObjectId.is_valid(user_id):
+        user_id = ObjectId(user_id)
+    user = superdesk.get_resource_service('users').find_one(req=None, _id=user_id)
+    if not user or not user.get('is_enabled'):
+        unregister_topic(topic)
+        return
+
+    company = None
+    if user.get('company'):
+        company = superdesk.get_resource_service('companies').find_one(req=None, _id=user['company'])
+
+    query = get_topic_query(topic, user, company)
+    if not query:
+        unregister_topic(topic)
+        return
+
+    es, index = _get_elastic()
+    es.index(index=index, doc_type=PERCOLATOR_TYPE, id=str(topic['_id']), body={
+        'query': query,
+        'topic_type': topic.get('topic_type'),
+        'user': str(topic.get('user')),
+    })
+
+
+def unregister_topic(topic):
+    es, index = _get_elastic()
+    try:
+        es.delete(index=index, doc_type=PERCOLATOR_TYPE, id=str(topic['_id']))
+    except elasticsearch.NotFoundError:
+        pass
+
+
+def sync_topics(user_id=None):
+    """Register all topics with notifications, to be used after products or section filters changes.
+
+    :param user_id: only register topics of given user
+    """
+    lookup = {'user': ObjectId(user_id)} if user_id else None
+    count = 0
+    for topic in superdesk.get_resource_service('topics').get(req=None, lookup=lookup):
+        register_topic(topic)
+        if topic.get('notifications') and topic.get('topic_type') in PERCOLATOR_TOPIC_TYPES:
+            count += 1
+    return count
+
+
+@celery.task(soft_time_limit=600)
+def sync_topics_task(user_id=None):
+    sync_topics(user_id)
+
+
+def sync_topics_async(user_id=None):
+    """Register topics again using celery worker.
+
+    Percolator queries contain product, company and section filters,
+    so these must be registered again when any of it changes.
+
+    :param user_id: only register topics of given user
+    """
+    if is_percolator_enabled():
+        sync_topics_task.delay(str(user_id) if user_id else None)
+
+
+class PercolatorSyncServiceMixin():
+    """Service mixin registering percolator topics again on every write."""
+
+    def create(self, docs, **kwargs):
+        ids = super().create(docs, **kwargs)
+        sync_topics_async()
+        return ids
+
+    def update(self, id, updates, original):
+        res = super().update(id, updates, original)
+        sync_topics_async()
+        return res
+
+    def system_update(self, id, updates, original):
+        res = super().system_update(id, updates, original)
+        sync_topics_async()
+        return res
+
+    def replace(self, id, document, original):
+        res = super().replace(id, document, original)
+        sync_topics_async()
+        return res
+
+    def delete(self, lookup):
+        res = super().delete(lookup)
+        sync_topics_async()
+        return res
+
+
+def get_matching_topics(item, users, companies):
+    """Get topics matching given item using percolator.
+
+    :param item: item, it must be indexed already
+    :param users: user_id, user dictionary
+    :param companies: company_id, company dictionary
+    :return: list of matching topics
+    """
+    es, index = _get_elastic()
+    try:
+        result = es.percolate(index=index, doc_type='items', id=item['_id'])
+    except elasticsearch.NotFoundError:
+        return []
+
+    topic_ids = [match['_id'] for match in result.get('matches', [])]
+    if not topic_ids:
+        return []
+
+    lookup = {'_id': {'$in': [ObjectId(_id) if ObjectId.is_valid(_id) else _id for _id in topic_ids]}}
+    topics = superdesk.get_resource_service('topics').get(req=None, lookup=lookup)
+
+    matching = []
+    for topic in topics:
+        user = users.get(str(topic['user']))
+        if not user:
+            continue
+        if not is_admin(user) and not companies.get(str(user.get('company', ''))):
+            logger.info('Notification for user:{} and topic:{} is skipped'.format(user.get('_id'), topic.get('_id')))
+            continue
+        if _is_relative_created(topic) and not _is_in_created_range(item, topic):
+            continue
+        matching.append(topic)
+    return matching
@@ -2,6 +2,8 @@
 import newsroom
 import superdesk
 
+from newsroom.cache import CachedResourceServiceMixin
+
 
 class TopicsResource(newsroom.Resource):
     url = 'users/<regex("[a-f0-9]{24}"):user>/topics'
@@ -21,8 +23,26 @@ class TopicsResource(newsroom.Resource):
     }
 
 
-class TopicsService(newsroom.Service):
-    pass
+class TopicsService(CachedResourceServiceMixin, newsroom.Service):
+    def on_created(self, docs):
+        for doc in docs:
+            update_topic_percolator(doc)
+
+    def on_updated(self, updates, original):
+        topic = original.copy()
+        topic.update(updates)
+        update_topic_percolator(topic)
+
+    def on_deleted(self, doc):
+        from newsroom.topics import percolator
+        if percolator.is_percolator_enabled():
+            percolator.unregister_topic(doc)
+
+
+def update_topic_percolator(topic):
+    from newsroom.topics import percolator
+    if percolator.is_percolator_enabled():
+        percolator.register_topic(topic)
 
 
 def get_user_topics(user_id):
@@ -46,7 +46,7 @@ def delete(id):
     if not is_user_topic(id, session['user']):
         abort(403)
 
-    get_resource_service('topics').delete({'_id': ObjectId(id)})
+    get_resource_service('topics').delete_action({'_id': ObjectId(id)})
     push_user_notification('topics')
     return jsonify({'success': True}), 200
 
@@ -5,6 +5,7 @@ import newsroom
 from content_api import MONGO_PREFIX
 from superdesk.utils import is_hashed, get_hash
 from newsroom.auth import get_user_id
+from newsroom.cache import CachedResourceServiceMixin
 
 
 class UsersResource(newsroom.Resource):
@@ -81,6 +82,9 @@ class UsersResource(newsroom.Resource):
         'locale': {
             'type': 'string',
         },
+        'feed_secret': {
+            'type': 'string',
+        },
     }
 
     item_methods = ['GET', 'PATCH', 'PUT']
@@ -96,7 +100,7 @@ class UsersResource(newsroom.Resource):
     }
 
 
-class UsersService(newsroom.Service):
+class UsersService(CachedResourceServiceMixin, newsroom.Service):
     """
     A service that knows how to perform CRUD operations on the `users`
     collection.
@@ -104,6 +108,8 @@ class UsersService(newsroom.Service):
     Serves mainly as a proxy to the data layer.
     """
 
+    cache_per_document = True
+
     def on_create(self, docs):
         super().on_create(docs)
         for doc in docs:
@@ -119,6 +125,11 @@ class UsersService(newsroom.Service):
         if updates.get('locale') and original['_id'] == get_user_id() and updates['locale'] != original.get('locale'):
             session['locale'] = updates['locale']
 
+        # topic percolator queries depend on user company and permissions
+        if any(key in updates for key in ('company', 'is_enabled', 'user_type')):
+            from newsroom.topics import percolator
+            percolator.sync_topics_async(original['_id'])
+
     def _get_password_hash(self, password):
         return get_hash(password, app.config.get('BCRYPT_GENSALT_WORK_FACTOR', 12))
 
@@ -0,0 +1,174 @@
+"""Home dashboard cards cache.
+
+Items are cached per card, a card is invalidated only when pushed item matches
+its product. Invalidated card is served stale while single request is refreshing it,
+requests for card which is not cached at all wait for the request loading it.
+
+Invalidation doesn't modify cached items, it only stores the time of invalidation
+next to it, so it can't be lost when the card is being refreshed concurrently.
+"""
+
+import time
+import hashlib
+import superdesk
+
+from bson import ObjectId
+from flask import current_app as app, json
+
+from newsroom.cache import get_cache_version, get_cached
+
+DASHBOARD = 'newsroom'
+REFRESH_LOCK_TIMEOUT = 30
+REFRESH_WAIT_TIMEOUT = 5
+REFRESH_WAIT_INTERVAL = 0.1
+
+
+def get_card_cache_key(card):
+    key = json.dumps([card.get('type'), card.get('config'), get_cache_version('products')], sort_keys=True)
+    return 'home-card:{}'.format(hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def _get_invalidated_key(key):
+    return '{}:invalidated'.format(key)
+
+
+def _get_lock_key(key):
+    return '{}:refresh'.format(key)
+
+
+def is_cached_card(card):
+    return bool(card.get('config', {}).get('product')) or card.get('type') == '4-photo-gallery'
+
+
+def is_fresh(cached, invalidated):
+    """Test if cached card items are fresh.
+
+    :param cached: cached card data
+    :param invalidated: time when card was invalidated last time
+    """
+    return cached['fresh_until'] > time.time() and (invalidated is None or invalidated < cached['loaded'])
+
+
+def load_cards_items(cards):
+    """Load items for cards, all product cards are loaded using single search request."""
+    product_cards = [card for card in cards if card['config'].get('product')]
+    products_items = iter(superdesk.get_resource_service('wire_search').get_products_items([
+        (ObjectId(card['config']['product']), card['config']['size']) for card in product_cards
+    ]))
+    return [next(products_items) if card['config'].get('product') else app.get_media_cards_external(card)
+            for card in cards]
+
+
+def set_card_items(card, items, loaded):
+    """Store card items in cache.
+
+    :param card: card
+    :param items: card items
+    :param loaded: time when loading of items started
+    """
+    app.cache.set(get_card_cache_key(card), {
+        'items': items,
+        'loaded': loaded,
+        'fresh_until': loaded + app.config['HOME_CARD_CACHE_TIMEOUT'],
+    }, timeout=app.config['HOME_CARD_CACHE_STALE_TIMEOUT'])
+
+
+def refresh_cards(cards, items_by_card):
+    """Load items for cards and store it in cache."""
+    loaded = time.time()
+    for card, items in zip(cards, load_cards_items(cards)):
+        set_card_items(card, items, loaded)
+        items_by_card[card['label']] = items
+
+
+def wait_for_cards(cards, items_by_card):
+    """Wait for other request loading cards, returns cards which were not loaded in time."""
+    deadline = time.time() + REFRESH_WAIT_TIMEOUT
+    while cards and time.time() < deadline:
+        time.sleep(REFRESH_WAIT_INTERVAL)
+        waiting = []
+        for card in cards:
+            cached = app.cache.get(get_card_cache_key(card))
+            if cached is not None:
+                items_by_card[card['label']] = cached['items']
+            else:
+                waiting.append(card)
+        cards = waiting
+    return cards
+
+
+def get_items_by_card(cards):
+    """Get items for cards using cache.
+
+    Cards which are not cached or are stale are loaded together by single request,
+    stale items are returned if other request is already refreshing the card and
+    requests for cards which are not cached wait until other request loads them.
+    """
+    items_by_card = {}
+    refresh = []
+    waiting = []
+    locks = []
+    for card in cards:
+        if not is_cached_card(card):
+            continue
+        key = get_card_cache_key(card)
+        cached, invalidated = app.cache.get_many(key, _get_invalidated_key(key))
+        if cached is not None and is_fresh(cached, invalidated):
+            items_by_card[card['label']] = cached['items']
+            continue
+        lock_key = _get_lock_key(key)
+        if not app.cache.add(lock_key, 1, timeout=REFRESH_LOCK_TIMEOUT):
+            if cached is not None:
+                items_by_card[card['label']] = cached['items']
+            else:
+                waiting.append(card)
+            continue
+        locks.append(lock_key)
+        refresh.append(card)
+
+    try:
+        refresh_cards(refresh, items_by_card)
+    finally:
+        for lock_key in locks:
+            app.cache.delete(lock_key)
+
+    refresh_cards(wait_for_cards(waiting, items_by_card), items_by_card)
+    return items_by_card
+
+
+def get_product_cards():
+    """Get dashboard cards with product."""
+    return get_cached('cards', 'products:{}'.format(DASHBOARD), lambda: [
+        card for card in superdesk.get_resource_service('cards').get(req=None, lookup={'dashboard': DASHBOARD})
+        if card.get('config', {}).get('product')
+    ])
+
+
+def invalidate_cards(item):
+    """Mark cards with products matching given item as stale.
+
+    Only cards which are cached and fresh are checked, so there is no search
+    when all cards are stale already.
+
+    :param item: published wire item
+    """
+    cards = []
+    for card in get_product_cards():
+        key = get_card_cache_key(card)
+        cached, invalidated = app.cache.get_many(key, _get_invalidated_key(key))
+        if cached is not None and is_fresh(cached, invalidated):
+            cards.append(card)
+    if not cards:
+        return
+
+    product_ids = sorted(set(card['config']['product'] for card in cards))
+    products = get_cached('products', 'ids:{}'.format(','.join(product_ids)), lambda: list(
+        superdesk.get_resource_service('products').get(
+            req=None, lookup={'_id': {'$in': [ObjectId(_id) for _id in product_ids]}})))
+    matching = superdesk.get_resource_service('wire_search').get_matching_products(item['_id'], products)
+
+    now = time.time()
+    for card in cards:
+        if card['config']['product'] in matching:
+            app.cache.set(_get_invalidated_key(get_card_cache_key(card)), now,
+                          timeout=app.config['HOME_CARD_CACHE_STALE_TIMEOUT'])
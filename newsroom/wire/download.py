@@ -0,0 +1,295 @@
+"""Streaming download of multiple items as zip file."""
+
+import io
+import os
+import json
+import hashlib
+import logging
+import zipfile
+import threading
+import superdesk
+import multiprocessing.pool
+
+from collections import deque, OrderedDict
+from flask import current_app as app
+from redis.exceptions import RedisError
+from werkzeug.utils import secure_filename
+
+from newsroom.utils import parse_dates
+
+DOWNLOAD_BATCH_SIZE = 50
+
+logger = logging.getLogger(__name__)
+
+_format_pool = None
+_format_pool_pid = None
+_format_pool_lock = threading.Lock()
+_worker_app = None
+
+
+class ZipStream(io.RawIOBase):
+    """Write only file buffering data written by :class:`zipfile.ZipFile` until it's read."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def read_written(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+class FormattedItemsCache():
+    """In process LRU cache of formatted items limited by total size of cached content.
+
+    There is single entry per item, format and item type, so storing new version
+    of an item replaces the previous one.
+    """
+
+    def __init__(self):
+        self._items = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            cached = self._items.get(key)
+            if cached is None or cached[0] != version:
+                return None
+            self._items.move_to_end(key)
+            return cached[1]
+
+    def set(self, key, version, content, max_size):
+        with self._lock:
+            self._pop(key)
+            if len(content) > max_size:
+                return
+            self._items[key] = (version, content)
+            self._size += len(content)
+            while self._size > max_size:
+                self._pop(next(iter(self._items)))
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._size = 0
+
+    def _pop(self, key):
+        cached = self._items.pop(key, None)
+        if cached is not None:
+            self._size -= len(cached[1])
+
+
+def get_formatted_items_cache():
+    return app.extensions.setdefault('formatted_items_cache', FormattedItemsCache())
+
+
+def _get_item_version(item):
+    version = [str(item.get(field) or '') for field in ('version', '_current_version', 'versioncreated', '_updated')]
+    return hashlib.sha1(json.dumps(version).encode('utf-8')).hexdigest()
+
+
+def _get_redis_key(key, version):
+    return 'download-format:{}:{}:{}:{}'.format(key[2], key[1], key[0], version)
+
+
+def get_formatted_item(_format, item, item_type):
+    """Get formatted item from cache.
+
+    :param _format: download format name
+    :param item: item dict
+    :param item_type: either items or agenda
+    :return: formatted item or ``None`` if it's not cached
+    """
+    if not app.config.get('DOWNLOAD_CACHE_SIZE'):
+        return None
+    key, version = (item['_id'], _format, item_type), _get_item_version(item)
+    content = get_formatted_items_cache().get(key, version)
+    if content is None and app.config.get('DOWNLOAD_CACHE_REDIS'):
+        try:
+            content = app.redis.get(_get_redis_key(key, version))
+        except RedisError as err:
+            logger.warning('Failed to get formatted item from redis: %s', err)
+        if content is not None:
+            get_formatted_items_cache().set(key, version, content, app.config['DOWNLOAD_CACHE_SIZE'])
+    return content
+
+
+def set_formatted_item(_format, item, item_type, content):
+    """Store formatted item in cache.
+
+    Items bigger than ``DOWNLOAD_CACHE_MAX_ITEM_SIZE`` are not cached.
+    """
+    if not app.config.get('DOWNLOAD_CACHE_SIZE') or len(content) > app.config['DOWNLOAD_CACHE_MAX_ITEM_SIZE']:
+        return
+    key, version = (item['_id'], _format, item_type), _get_item_version(item)
+    get_formatted_items_cache().set(key, version, content, app.config['DOWNLOAD_CACHE_SIZE'])
+    if app.config.get('DOWNLOAD_CACHE_REDIS'):
+        try:
+            app.redis.set(_get_redis_key(key, version), content, ex=app.config['DOWNLOAD_CACHE_TIMEOUT'])
+        except RedisError as err:
+            logger.warning('Failed to store formatted item in redis: %s', err)
+
+
+def format_item(_format, item, item_type):
+    """Format item for download using cache.
+
+    :param _format: download format name
+    :param item: item dict
+    :param item_type: either items or agenda
+    """
+    content = get_formatted_item(_format, item, item_type)
+    if content is None:
+        formatter = app.download_formatters[_format]['formatter']
+        content = formatter.format_item(item, item_type=item_type)
+        set_formatted_item(_format, item, item_type, content)
+    return content
+
+
+def get_download_items(ids, item_type):
+    """Generate items to download in order of given ids.
+
+    Items are fetched using service in batches, so only a single batch is kept in memory.
+
+    :param ids: list of item ids
+    :param item_type: either items or agenda
+    """
+    service = superdesk.get_resource_service(item_type)
+    for i in range(0, len(ids), DOWNLOAD_BATCH_SIZE):
+        batch = ids[i:i + DOWNLOAD_BATCH_SIZE]
+        items = {item['_id']: item for item in service.find({'_id': {'$in': batch}})}
+        for _id in batch:
+            if _id in items:
+                yield items[_id]
+
+
+def parse_items_dates(items):
+    """Generate items with dates parsed."""
+    for item in items:
+        parse_dates(item)  # fix for old items
+        yield item
+
+
+def _get_filename(_format, item):
+    return secure_filename(app.download_formatters[_format]['formatter'].format_filename(item))
+
+
+def format_items(_format, items, item_type):
+    """Generate ``(filename, content)`` for every item.
+
+    :param _format: download format name
+    :param items: iterable of items
+    :param item_type: either items or agenda
+    """
+    for item in items:
+        parse_dates(item)  # fix for old items
+        yield _get_filename(_format, item), format_item(_format, item, item_type)
+
+
+def get_format_pool(processes):
+    """Get process pool for formatting items, it's created once per web process.
+
+    Workers are started using ``spawn``, so they don't inherit open mongo and elastic
+    clients or locks of threaded web process, and create own app instance instead.
+    """
+    global _format_pool, _format_pool_pid
+    with _format_pool_lock:
+        if _format_pool is None or _format_pool_pid != os.getpid():
+            _format_pool = multiprocessing.get_context('spawn').Pool(processes, initializer=_init_format_worker)
+            _format_pool_pid = os.getpid()
+        return _format_pool
+
+
+def reset_format_pool(pool):
+    """Terminate broken pool, new one is created on next use."""
+    global _format_pool
+    with _format_pool_lock:
+        if _format_pool is pool:
+            _format_pool = None
+    pool.terminate()
+
+
+def _init_format_worker():
+    """Create app instance in worker process."""
+    global _worker_app
+    from newsroom.flaskapp import Newsroom
+    _worker_app = Newsroom('newsroom_format')
+
+
+def _format_item(_format, item, item_type):
+    """Format item in worker process."""
+    with _worker_app.app_context():
+        formatter = _worker_app.download_formatters[_format]['formatter']
+        return formatter.format_item(item, item_type=item_type)
+
+
+def format_items_parallel(_format, items, item_type, processes):
+    """Generate ``(filename, content)`` for every item formatting items in worker processes.
+
+    Results are generated in items order, only a few items per worker are
+    sent to workers ahead so memory use stays bounded. Cached items are not
+    sent to workers at all.
+
+    If a worker doesn't return result in ``DOWNLOAD_FORMAT_TIMEOUT``, eg. because
+    it was killed, the pool is replaced and remaining items are formatted in web process.
+
+    :param _format: download format name
+    :param items: iterable of items
+    :param item_type: either items or agenda
+    :param processes: number of worker processes
+    """
+    pool = get_format_pool(processes)
+    pending = deque()
+    broken = False
+
+    def get_next():
+        nonlocal broken
+        item, content = pending.popleft()
+        if isinstance(content, multiprocessing.pool.AsyncResult):
+            try:
+                if broken:
+                    raise multiprocessing.TimeoutError()
+                content = content.get(timeout=app.config['DOWNLOAD_FORMAT_TIMEOUT'])
+            except multiprocessing.TimeoutError:
+                if not broken:
+                    logger.error('Formatting item %s in worker process timed out, replacing pool', item['_id'])
+                    broken = True
+                    reset_format_pool(pool)
+                return _get_filename(_format, item), format_item(_format, item, item_type)
+            set_formatted_item(_format, item, item_type, content)
+        return _get_filename(_format, item), content
+
+    for item in items:
+        parse_dates(item)  # fix for old items
+        content = get_formatted_item(_format, item, item_type)
+        if content is None:
+            content = format_item(_format, item, item_type) if broken else \
+                pool.apply_async(_format_item, (_format, item, item_type))
+        pending.append((item, content))
+        if len(pending) >= processes * 2:
+            yield get_next()
+    while pending:
+        yield get_next()
+
+
+def stream_zip(files):
+    """Generate zip file content, writing files one by one.
+
+    Only a single file is kept in memory at a time.
+
+    :param files: iterable of ``(filename, content)``
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, mode='w') as zf:
+        for filename, content in files:
+            zf.writestr(filename, content)
+            yield stream.read_written()
+    yield stream.read_written()
@@ -1,16 +1,21 @@
+import hashlib
 import logging
+from collections import OrderedDict
+from copy import deepcopy
 from datetime import datetime, timedelta
 
-from eve.utils import ParsedRequest
-from flask import current_app as app, json, abort
+from eve.utils import ParsedRequest, config
+from flask import current_app as app, json, abort, request
 from flask_babel import gettext
 from superdesk import get_resource_service
 from werkzeug.exceptions import Forbidden
 
 import newsroom
 from newsroom.auth import get_user
+from newsroom.cache import get_cached, get_cache_version
 from newsroom.companies import get_user_company
-from newsroom.products.products import get_products_by_company, get_products_by_navigation
+from newsroom.products.products import get_products_by_company, get_products_by_navigations
+from newsroom.pagination import get_cursor_query, get_next_cursor
 from newsroom.settings import get_setting
 from newsroom.template_filters import is_admin
 from newsroom.wire.utils import get_local_date, get_end_date
@@ -48,62 +53,98 @@ class WireSearchResource(newsroom.Resource):
     resource_methods = ['GET']
 
 
+def search_with_cached_aggregations(resource, source, search):
+    """Run search using cached aggregations if there are any.
+
+    Aggregations are cached using search query and aggregations definition,
+    so searching again in the same context only fetches items.
+
+    :param resource: resource name
+    :param source: search source
+    :param search: function running search for given source, returns cursor
+    """
+    timeout = app.config.get('AGGREGATIONS_CACHE_TIMEOUT')
+    if not source.get('aggs') or not timeout:
+        return search(source)
+
+    key = json.dumps([resource, source['query'], source['aggs']], sort_keys=True)
+    key = 'aggregations:{}'.format(hashlib.sha1(key.encode('utf-8')).hexdigest())
+    aggregations = app.cache.get(key)
+    if aggregations is not None:
+        cursor = search({k: v for k, v in source.items() if k != 'aggs'})
+        cursor.hits = dict(cursor.hits, aggregations=aggregations)
+    else:
+        cursor = search(source)
+        if cursor.hits.get('aggregations') is not None:
+            app.cache.set(key, cursor.hits['aggregations'], timeout=timeout)
+    return cursor
+
+
 def get_aggregation_field(key):
     return get_aggregations()[key]['terms']['field']
 
 
-def set_product_query(query, company, section, user=None, navigation_id=None, events_only=False):
-    """
-    Checks the user for admin privileges
-    If user is administrator then there's no filtering
-    If user is not administrator then products apply if user has a company
-    If user is not administrator and has no company then everything will be filtered
-    :param query: search query
-    :param company: company
-    :param section: section i.e. wire, agenda, marketplace etc
-    :param user: user to check against (used for notification checking)
-    :param navigation_id: navigation to filter products
-    :param events_only: From agenda to display events only or not
-    If not provided session user will be checked
+class ProductQuery():
+    """Compiled product entitlements filter.
+
+    It contains query parts for company products, company type filters and wire time limit,
+    so it can be applied to any search query.
+
+    :param should: product queries, at least one must match
+    :param must: additional must filters
+    :param must_not: additional must not filters
+    :param no_products: company has no products so nothing is allowed
     """
-    products = None
 
-    if is_admin(user):
-        if navigation_id:
-            products = get_products_by_navigation(navigation_id)
-        else:
-            return  # admin will see everything by default
+    def __init__(self, should=None, must=None, must_not=None, no_products=False):
+        self.should = should or []
+        self.must = must or []
+        self.must_not = must_not or []
+        self.no_products = no_products
 
-    if company:
-        products = get_products_by_company(company['_id'], navigation_id, product_type=section)
-    else:
-        # user does not belong to a company so blocking all stories
-        abort(403, gettext('User does not belong to a company.'))
+    def to_dict(self):
+        return dict(should=self.should, must=self.must, must_not=self.must_not, no_products=self.no_products)
+
+    def apply(self, query):
+        """Apply filter to given query."""
+        query['bool']['should'] = deepcopy(self.should)
+        query['bool']['must'] += deepcopy(self.must)
+        query['bool']['must_not'] += deepcopy(self.must_not)
+        query['bool']['minimum_should_match'] = 1
+        if self.no_products:
+            abort(403, gettext('Your company doesn\'t have any products defined.'))
+
+
+_product_queries = OrderedDict()  # in process cache of compiled filters
+
+
+def _compile_product_query(company, section, admin, navigation_id=None, events_only=False):
+    products = get_products_by_company(company['_id'], navigation_id, product_type=section)
+    product_query = ProductQuery()
 
-    query['bool']['should'] = []
     product_ids = [p['sd_product_id'] for p in products if p.get('sd_product_id')]
     if product_ids:
-        query['bool']['should'].append({'terms': {'products.code': product_ids}})
+        product_query.should.append({'terms': {'products.code': product_ids}})
 
     # add company type filters (if any)
-    if company and company.get('company_type'):
+    if company.get('company_type'):
         for company_type in app.config.get('COMPANY_TYPES', []):
             if company_type['id'] == company['company_type']:
                 if company_type.get('wire_must'):
-                    query['bool']['must'].append(company_type['wire_must'])
+                    product_query.must.append(company_type['wire_must'])
                 if company_type.get('wire_must_not'):
-                    query['bool']['must_not'].append(company_type['wire_must_not'])
+                    product_query.must_not.append(company_type['wire_must_not'])
 
     planning_items_should = []
     for product in products:
         if product.get('query'):
-            query['bool']['should'].append(query_string(product['query']))
+            product_query.should.append(query_string(product['query']))
             if product.get('planning_item_query') and not events_only:
                 # form the query for the agenda planning items
                 planning_items_should.append(planning_items_query_string(product.get('planning_item_query')))
 
     if planning_items_should:
-        query['bool']['should'].append(
+        product_query.should.append(
             nested_query(
                 'planning_items',
                 {
@@ -113,16 +154,70 @@ def set_product_query(query, company, section, user=None, navigation_id=None, ev
             )
         )
 
-    query['bool']['minimum_should_match'] = 1
-
     wire_time_limit_days = get_setting('wire_time_limit_days')
-    if company and not is_admin(user) and not company.get('archive_access', False) and wire_time_limit_days:
-        query['bool']['must'].append({'range': {'versioncreated': {
+    if not admin and not company.get('archive_access', False) and wire_time_limit_days:
+        product_query.must.append({'range': {'versioncreated': {
             'gte': 'now-%dd/d' % int(wire_time_limit_days),
         }}})
 
-    if not query['bool']['should']:
-        abort(403, gettext('Your company doesn\'t have any products defined.'))
+    product_query.no_products = not product_query.should
+    return product_query
+
+
+def get_product_query(company, section, user=None, navigation_id=None, events_only=False):
+    """Get compiled product filter for company and section.
+
+    Filters are cached in process and in ``app.cache``, cache key contains products,
+    companies and settings versions so it's invalidated when any of these changes.
+
+    :param company: company
+    :param section: section i.e. wire, agenda, marketplace etc
+    :param user: user to check against, if not provided session user will be checked
+    :param navigation_id: navigation to filter products
+    :param events_only: from agenda to display events only or not
+    :return: ``ProductQuery`` or ``None`` if there is no filtering
+    """
+    admin = is_admin(user)
+    if admin and not navigation_id:
+        return  # admin will see everything by default
+
+    if not company:
+        # user does not belong to a company so blocking all stories
+        abort(403, gettext('User does not belong to a company.'))
+
+    key = ':'.join(map(str, [
+        get_cache_version('products'), get_cache_version('companies'), get_cache_version('settings'),
+        company['_id'], section, navigation_id, events_only, admin,
+    ]))
+
+    if key not in _product_queries:
+        data = get_cached('product_query', key, lambda: _compile_product_query(
+            company, section, admin, navigation_id, events_only).to_dict())
+        _product_queries[key] = ProductQuery(**data)
+        while len(_product_queries) > app.config.get('PRODUCT_QUERY_CACHE_SIZE', 1000):
+            _product_queries.popitem(last=False)
+
+    return _product_queries[key]
+
+
+def set_product_query(query, company, section, user=None, navigation_id=None, events_only=False):
+    """
+    Checks the user for admin privileges
+    If user is administrator then there's no filtering
+    If user is not administrator then products apply if user has a company
+    If user is not administrator and has no company then everything will be filtered
+    :param query: search query
+    :param company: company
+    :param section: section i.e. wire, agenda, marketplace etc
+    :param user: user to check against (used for notification checking)
+    :param navigation_id: navigation to filter products
+    :param events_only: From agenda to display events only or not
+    If not provided session user will be checked
+    """
+    product_query = get_product_query(company, section, user=user, navigation_id=navigation_id,
+                                      events_only=events_only)
+    if product_query:
+        product_query.apply(query)
 
 
 def query_string(query):
@@ -247,6 +342,12 @@ class WireSearchService(newsroom.Service):
             if req.args.get('created_from') or req.args.get('created_to'):
                 query['bool']['must'].append(versioncreated_range(req.args))
 
+        if req.args.get('after'):
+            cursor_query = get_cursor_query(req.args['after'], 'versioncreated', 'desc')
+            if not cursor_query:
+                return abort(400)
+            query['bool']['must'].append(cursor_query)
+
         source = {'query': query}
         source['sort'] = [{'versioncreated': 'desc'}]
         source['size'] = size
@@ -264,31 +365,52 @@ class WireSearchService(newsroom.Service):
             # https://www.elastic.co/guide/en/elasticsearch/guide/current/pagination.html#pagination
             return abort(400)
 
-        if not source['from'] and aggs:  # avoid aggregations when handling pagination
+        if not source['from'] and not req.args.get('after') and aggs:  # avoid aggregations when handling pagination
             source['aggs'] = get_aggregations()
 
-        internal_req = ParsedRequest()
-        internal_req.args = {'source': json.dumps(source)}
-        return super().get(internal_req, lookup)
+        def search(source):
+            internal_req = ParsedRequest()
+            internal_req.args = {'source': json.dumps(source)}
+            return super(WireSearchService, self).get(internal_req, lookup)
+
+        return search_with_cached_aggregations(self.datasource, source, search)
+
+    def on_fetched(self, doc):
+        doc['_next'] = get_next_cursor(doc[config.ITEMS], 'versioncreated', request.args.get('after'))
 
     def has_permissions(self, item, ignore_latest=False):
         """Test if current user has permissions to view given item."""
-        req = ParsedRequest()
-        req.args = {}
-        try:
-            results = self.get(req, {'_id': item['_id']}, size=0, aggs=False, ignore_latest=ignore_latest)
-            return results.count() > 0
-        except Forbidden:
-            return False
+        return item['_id'] in self.has_permissions_many([item['_id']], ignore_latest)
 
-    def get_product_items(self, product_id, size):
-        query = _items_query()
+    def has_permissions_many(self, item_ids, ignore_latest=False):
+        """Get ids of items current user has permissions to view.
 
-        product = get_resource_service('products').find_one(req=None, _id=product_id)
+        It runs a single search using ``terms`` filter for all items.
 
-        if not product:
-            return
+        :param item_ids: list of item ids
+        :param ignore_latest: check also items which are not the latest version
+        :return: set of accessible item ids
+        """
+        item_ids = list(set(item_ids))
+        if not item_ids:
+            return set()
+
+        query = _items_query(ignore_latest)
+        get_resource_service('section_filters').apply_section_filter(query, self.section)
+        try:
+            set_product_query(query, get_user_company(get_user()), self.section)
+        except Forbidden:
+            return set()
+
+        query['bool']['must'].append({'terms': {'_id': item_ids}})
+        source = {'query': query, 'size': len(item_ids)}
+        internal_req = ParsedRequest()
+        internal_req.args = {'source': json.dumps(source), 'projections': json.dumps(['_id'])}
+        return set(item['_id'] for item in super().get(internal_req, None))
 
+    def get_product_items_query(self, product):
+        """Get query for items of given product."""
+        query = _items_query()
         query['bool']['should'] = []
         get_resource_service('section_filters').apply_section_filter(query, product.get('product_type'))
 
@@ -299,17 +421,95 @@ class WireSearchService(newsroom.Service):
             query['bool']['should'].append(query_string(product['query']))
 
         query['bool']['minimum_should_match'] = 1
+        return query
+
+    def get_matching_products(self, item_id, products):
+        """Get ids of products matching given item using single search.
+
+        :param item_id: item id
+        :param products: list of products
+        :return: set of product ids as strings
+        """
+        if not products:
+            return set()
+
+        source = {
+            'query': {'bool': {'must': [{'term': {'_id': item_id}}]}},
+            'size': 0,
+            'aggs': {
+                'products': {
+                    'filters': {
+                        'filters': {str(product['_id']): self.get_product_items_query(product) for product in products}
+                    }
+                }
+            }
+        }
+        req = ParsedRequest()
+        req.args = {'source': json.dumps(source)}
+        buckets = super().get(req, None).hits['aggregations']['products']['buckets']
+        return set(product_id for product_id, bucket in buckets.items() if bucket['doc_count'])
 
+    def get_product_items_source(self, product, size):
+        query = self.get_product_items_query(product)
         source = {'query': query}
         source['sort'] = [{'versioncreated': 'desc'}]
         source['size'] = size
         source['from'] = 0
         source['post_filter'] = {'bool': {'must': []}}
+        return source
+
+    def get_product_items(self, product_id, size):
+        product = get_resource_service('products').find_one(req=None, _id=product_id)
+
+        if not product:
+            return
 
         internal_req = ParsedRequest()
-        internal_req.args = {'source': json.dumps(source)}
+        internal_req.args = {'source': json.dumps(self.get_product_items_source(product, size))}
         return list(super().get(internal_req, None))
 
+    def get_products_items(self, products_sizes):
+        """Get items for multiple products using single products query and single elastic request.
+
+        :param products_sizes: list of ``(product_id, size)``
+        :return: list of items lists in the same order, ``None`` for missing products
+        """
+        if not products_sizes:
+            return []
+
+        product_ids = list(set(product_id for product_id, _ in products_sizes))
+        products = {product['_id']: product for product in get_resource_service('products').get(
+            req=None, lookup={'_id': {'$in': product_ids}})}
+
+        sources = [self.get_product_items_source(products[product_id], size)
+                   for product_id, size in products_sizes if product_id in products]
+        results = iter(self.msearch(sources))
+        return [list(next(results)) if product_id in products else None for product_id, _ in products_sizes]
+
+    def msearch(self, sources):
+        """Run multiple searches using single elastic request.
+
+        :param sources: list of search sources
+        :return: list of cursors in the same order
+        """
+        if not sources:
+            return []
+
+        backend = app.data._search_backend(self.datasource)
+        elastic_filter = config.SOURCES[self.datasource].get('elastic_filter')
+        body = []
+        for source in sources:
+            if elastic_filter:
+                source = dict(source, query={'filtered': {'query': source['query'], 'filter': elastic_filter}})
+            body.append({})
+            body.append(source)
+
+        responses = backend.elastic(self.datasource).msearch(body=body, **backend._es_args(self.datasource))
+        for source, response in zip(sources, responses['responses']):
+            if response.get('error'):
+                logger.error('Error in msearch for query: {} {}'.format(json.dumps(source), response['error']))
+        return [backend._parse_hits(response, self.datasource) for response in responses['responses']]
+
     def get_matching_topics(self, item_id, topics, users, companies):
         """
         Returns a list of topic ids matching to the given item_id
@@ -404,7 +604,12 @@ class WireSearchService(newsroom.Service):
 
         return topic_matches
 
-    def get_items(self, item_ids):
+    def get_items(self, item_ids, fields=None):
+        """Get items by ids.
+
+        :param item_ids: list of item ids
+        :param fields: optional list of fields to fetch, all fields are fetched by default
+        """
         try:
             query = {
                 'bool': {
@@ -422,6 +627,8 @@ class WireSearchService(newsroom.Service):
 
             req = ParsedRequest()
             req.args = {'source': json.dumps(source)}
+            if fields:
+                req.args['projections'] = json.dumps(fields)
 
             return super().get(req, None)
 
@@ -583,9 +790,10 @@ class WireSearchService(newsroom.Service):
             }
         }
 
+        products_by_navigation = get_products_by_navigations([navigation.get('_id') for navigation in navigations])
         for navigation in navigations:
             navigation_id = navigation.get('_id')
-            products = get_products_by_navigation(navigation_id) or []
+            products = products_by_navigation.get(str(navigation_id)) or []
             navigation_filter = {'bool': {'should': [], 'minimum_should_match': 1}}
             for product in products:
                 if product.get('query'):
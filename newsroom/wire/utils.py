@@ -1,5 +1,7 @@
 import pytz
+from elasticsearch.helpers import bulk
 from flask import request, current_app as app
+from pymongo import UpdateOne
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 from newsroom.auth import get_user_id
@@ -65,6 +67,10 @@ def get_end_date(date_range, start_date):
 def update_action_list(items, action_list, force_insert=False, item_type='items'):
     """
     Stores user id into array of action_list of an item
+
+    All items are updated using single mongo bulk write, then only the updated list
+    is fetched and sent to elastic using single bulk request.
+
     :param items: items to be updated
     :param action_list: field name of the list
     :param force_insert: inserts into list regardless of the http method
@@ -72,15 +78,34 @@ def update_action_list(items, action_list, force_insert=False, item_type='items'
     :return:
     """
     user_id = get_user_id()
-    if user_id:
+    if user_id and items:
         db = app.data.get_mongo_collection(item_type)
-        elastic = app.data._search_backend(item_type)
         if request.method == 'POST' or force_insert:
             updates = {'$addToSet': {action_list: user_id}}
         else:
             updates = {'$pull': {action_list: user_id}}
-        for item_id in items:
-            result = db.update_one({'_id': item_id}, updates)
-            if result.modified_count:
-                modified = db.find_one({'_id': item_id})
-                elastic.update(item_type, item_id, {action_list: modified[action_list]})
+        result = db.bulk_write([UpdateOne({'_id': item_id}, updates) for item_id in items], ordered=False)
+        if result.modified_count:
+            modified = db.find({'_id': {'$in': list(items)}}, projection={action_list: 1})
+            update_elastic_action_list(item_type, action_list, modified)
+
+
+def update_elastic_action_list(item_type, action_list, items):
+    """Update action list of items in elastic using single bulk request.
+
+    :param item_type: either items or agenda
+    :param action_list: field name of the list
+    :param items: items with ``_id`` and action list
+    """
+    elastic = app.data._search_backend(item_type)
+    args = elastic._es_args(item_type)
+    actions = [{
+        '_op_type': 'update',
+        '_index': args['index'],
+        '_type': args['doc_type'],
+        '_id': item['_id'],
+        '_retry_on_conflict': elastic._get_retry_on_conflict() or 0,
+        'doc': {action_list: item.get(action_list, [])},
+    } for item in items]
+    if actions:
+        bulk(elastic.elastic(item_type), actions, refresh=True)
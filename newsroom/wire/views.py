@@ -1,9 +1,8 @@
 import io
 import flask
-import zipfile
 import superdesk
 
-from bson import ObjectId
+from collections import OrderedDict
 from operator import itemgetter
 from flask import current_app as app, request
 from eve.render import send_response
@@ -17,6 +16,9 @@ from newsroom.navigations.navigations import get_navigations_by_company
 from newsroom.products.products import get_products_by_company
 from newsroom.wire import blueprint
 from newsroom.wire.utils import update_action_list
+from newsroom.wire.dashboard import get_items_by_card
+from newsroom.wire.download import get_download_items, format_item, format_items, format_items_parallel, \
+    parse_items_dates, stream_zip
 from newsroom.auth import get_user, get_user_id, login_required
 from newsroom.topics import get_user_topics
 from newsroom.email import send_email
@@ -29,8 +31,6 @@ from newsroom.template_filters import is_admin_or_internal
 
 from .search import get_bookmarks_count
 
-HOME_ITEMS_CACHE_KEY = 'home_items'
-
 
 def get_services(user):
     services = app.config['SERVICES']
@@ -44,12 +44,31 @@ def get_services(user):
 
 
 def set_permissions(item, section='wire', ignore_latest=False):
-    item['_access'] = superdesk.get_resource_service('{}_search'.format(section)).has_permissions(item, ignore_latest)
-    if not item['_access']:
-        item.pop('body_text', None)
-        item.pop('body_html', None)
-        item.pop('renditions', None)
-        item.pop('associations', None)
+    set_permissions_many([item], section, ignore_latest)
+
+
+def set_permissions_many(items, section='wire', ignore_latest=False):
+    """Set ``_access`` flag for items using single search and strip content from restricted ones."""
+    service = superdesk.get_resource_service('{}_search'.format(section))
+    allowed = service.has_permissions_many([item['_id'] for item in items], ignore_latest)
+    for item in items:
+        item['_access'] = item['_id'] in allowed
+        if not item['_access']:
+            item.pop('body_text', None)
+            item.pop('body_html', None)
+            item.pop('renditions', None)
+            item.pop('associations', None)
+
+
+def check_permissions_many(item_ids, section='wire'):
+    """Abort with 403 unless current user can access all given items.
+
+    Used by download and share, so users can't get content of items
+    which are not available to them. All items are checked using single search.
+    """
+    service = superdesk.get_resource_service('{}_search'.format(section))
+    if set(item_ids) - service.has_permissions_many(item_ids, ignore_latest=True):
+        flask.abort(403)
 
 
 def get_view_data():
@@ -70,22 +89,6 @@ def get_view_data():
     }
 
 
-def get_items_by_card(cards):
-    if app.cache.get(HOME_ITEMS_CACHE_KEY):
-        return app.cache.get(HOME_ITEMS_CACHE_KEY)
-
-    items_by_card = {}
-    for card in cards:
-        if card['config'].get('product'):
-            items_by_card[card['label']] = superdesk.get_resource_service('wire_search').\
-                get_product_items(ObjectId(card['config']['product']), card['config']['size'])
-        elif card['type'] == '4-photo-gallery':
-            items_by_card[card['label']] = app.get_media_cards_external(card)
-
-    app.cache.set(HOME_ITEMS_CACHE_KEY, items_by_card, timeout=300)
-    return items_by_card
-
-
 def get_home_data():
     user = get_user()
     cards = list(query_resource('cards', lookup={'dashboard': 'newsroom'}))
@@ -147,37 +150,53 @@ def download(_ids):
     user = get_user(required=True)
     _format = flask.request.args.get('format', 'text')
     item_type = get_type()
-    items = [get_entity_or_404(_id, item_type) for _id in _ids.split(',')]
-    _file = io.BytesIO()
+    section = request.args.get('type', 'wire')
+    ids = list(OrderedDict.fromkeys(_ids.split(',')))
     formatter = app.download_formatters[_format]['formatter']
-    mimetype = None
-    attachment_filename = '%s-newsroom.zip' % utcnow().strftime('%Y%m%d%H%M')
-    if len(items) == 1:
-        item = items[0]
+
+    if len(ids) == 1:
+        item = get_entity_or_404(ids[0], item_type)
+        if item_type == 'items':
+            check_permissions_many(ids, section)
+        items = [item]
         parse_dates(item)  # fix for old items
-        _file.write(formatter.format_item(item, item_type=item_type))
-        _file.seek(0)
-        mimetype = formatter.get_mimetype(item)
-        attachment_filename = secure_filename(formatter.format_filename(item))
+        _file = io.BytesIO(format_item(_format, item, item_type))
+        response = flask.send_file(_file, mimetype=formatter.get_mimetype(item), as_attachment=True,
+                                   attachment_filename=secure_filename(formatter.format_filename(item)))
     else:
-        with zipfile.ZipFile(_file, mode='w') as zf:
-            for item in items:
-                parse_dates(item)  # fix for old items
-                zf.writestr(
-                    secure_filename(formatter.format_filename(item)),
-                    formatter.format_item(item, item_type=item_type)
-                )
-        _file.seek(0)
-
-    update_action_list(_ids.split(','), 'downloads', force_insert=True)
+        # only fetch ids and versions here, items are fetched and formatted while streaming
+        items = list(app.data.get_mongo_collection(item_type).find(
+            {'_id': {'$in': ids}},
+            projection={'version': 1, '_current_version': 1}
+        ))
+        if len(items) != len(ids):
+            flask.abort(404)
+        if item_type == 'items':
+            check_permissions_many(ids, section)
+        if formatter.MULTIPLE_ITEMS:
+            content = formatter.format_items(parse_items_dates(get_download_items(ids, item_type)), item_type)
+            response = flask.Response(flask.stream_with_context(content), mimetype=formatter.MIMETYPE)
+            extension = formatter.FILE_EXTENSION
+        else:
+            processes = app.config.get('DOWNLOAD_FORMAT_PROCESSES', 0)
+            if processes and len(ids) >= app.config.get('DOWNLOAD_FORMAT_PROCESSES_MIN_ITEMS', 0):
+                files = format_items_parallel(_format, get_download_items(ids, item_type), item_type, processes)
+            else:
+                files = format_items(_format, get_download_items(ids, item_type), item_type)
+            response = flask.Response(flask.stream_with_context(stream_zip(files)), mimetype='application/zip')
+            extension = 'zip'
+        response.headers['Content-Disposition'] = 'attachment; filename={}'.format(
+            '%s-newsroom.%s' % (utcnow().strftime('%Y%m%d%H%M'), extension))
+
+    update_action_list(ids, 'downloads', force_insert=True)
     app.data.insert(
         'history',
         items,
         action='download',
         user=user,
-        section=request.args.get('type', 'wire')
+        section=section
     )
-    return flask.send_file(_file, mimetype=mimetype, attachment_filename=attachment_filename, as_attachment=True)
+    return response
 
 
 @blueprint.route('/wire_share', methods=['POST'])
@@ -189,6 +208,8 @@ def share():
     assert data.get('users')
     assert data.get('items')
     items = [get_entity_or_404(_id, item_type) for _id in data.get('items')]
+    if item_type == 'items':
+        check_permissions_many(data['items'], request.args.get('type', 'wire'))
     with app.mail.connect() as connection:
         for user_id in data['users']:
             user = superdesk.get_resource_service('users').find_one(req=None, _id=user_id)
@@ -1,8 +1,10 @@
 import pytz
 from flask import json
+from superdesk import get_resource_service
 from datetime import datetime
 from newsroom.wire.utils import get_local_date, get_end_date
 from newsroom.utils import get_location_string, get_agenda_dates, get_public_contacts
+from newsroom.agenda.feed import get_feed_url
 
 from .fixtures import items, init_items, agenda_items, init_agenda_items, init_auth, init_company, PUBLIC_USER_ID  # noqa
 from .utils import post_json, delete_json, get_json
@@ -477,3 +479,102 @@ def test_filter_events_only(client):
     assert 'urn:conference' == data['_items'][0]['_id']
     assert 'planning_items' not in data['_items'][0]
     assert 'coverages' not in data['_items'][0]
+
+
+def test_agenda_search_cursor_pagination(client, app):
+    app.data.insert('agenda', [{
+        '_id': 'urn:event:{}'.format(i),
+        'type': 'agenda',
+        'event_id': 'urn:event:{}'.format(i),
+        'name': 'Event {}'.format(i),
+        'dates': {
+            'start': datetime(2018, 5, 28, i, tzinfo=pytz.utc),
+            'end': datetime(2018, 5, 28, i + 1, tzinfo=pytz.utc),
+        },
+    } for i in range(3)])
+
+    data = get_json(client, '/agenda/search')
+    assert 4 == len(data['_items'])
+    assert data['_next']
+
+    data = get_json(client, '/agenda/search?after={}'.format(data['_next']))
+    assert 0 == len(data['_items'])
+    assert '_aggregations' not in data
+
+    resp = client.get('/agenda/search?after=foo')
+    assert 400 == resp.status_code
+
+
+def test_agenda_feed(client, app):
+    app.config['AGENDA_FEED_DAYS'] = 365 * 100
+    user = app.data.find_all('users')[0]
+    post_json(client, '/agenda_watch', {'items': ['urn:conference']})
+
+    with app.test_request_context():
+        url = get_feed_url(user)
+
+    resp = client.get(url)
+    assert 200 == resp.status_code
+    assert 'text/calendar' == resp.mimetype
+    data = resp.get_data()
+    assert data.startswith(b'BEGIN:VCALENDAR')
+    assert 1 == data.count(b'BEGIN:VEVENT')
+    assert resp.headers.get('ETag')
+    assert resp.headers.get('Last-Modified')
+
+    resp = client.get(url, headers={'If-None-Match': resp.headers['ETag']})
+    assert 304 == resp.status_code
+
+    delete_json(client, '/agenda_watch', {'items': ['urn:conference']})
+    resp = client.get(url)
+    assert 200 == resp.status_code
+    assert 0 == resp.get_data().count(b'BEGIN:VEVENT')
+
+    resp = client.get('/agenda/feed/foo.ics')
+    assert 404 == resp.status_code
+
+
+def test_agenda_feed_etag_changes_on_watch(client, app):
+    app.config['AGENDA_FEED_DAYS'] = 365 * 100
+    user = app.data.find_all('users')[0]
+
+    with app.test_request_context():
+        url = get_feed_url(user)
+
+    etag = client.get(url).headers['ETag']
+    post_json(client, '/agenda_watch', {'items': ['urn:conference']})
+    resp = client.get(url, headers={'If-None-Match': etag})
+    assert 200 == resp.status_code
+    assert resp.headers['ETag'] != etag
+
+
+def test_agenda_feed_reset(client, app):
+    user = app.data.find_all('users')[0]
+
+    with app.test_request_context():
+        url = get_feed_url(user)
+    assert 200 == client.get(url).status_code
+
+    resp = client.post('/agenda/feed/reset')
+    assert 200 == resp.status_code
+    new_url = json.loads(resp.get_data())['feed_url']
+    assert new_url != url
+    assert 404 == client.get(url).status_code
+    assert 200 == client.get(new_url).status_code
+
+
+def test_enhance_items_fetches_coverage_stories_at_once(client, app, mocker):
+    docs = [{
+        '_id': 'event%d' % i,
+        'coverages': [{
+            'coverage_id': 'cov%d' % i,
+            'workflow_status': 'completed',
+            'delivery_id': item_id,
+        }],
+    } for i, item_id in enumerate(['tag:foo', 'urn:localhost:weather'])]
+
+    get_items = mocker.spy(get_resource_service('wire_search'), 'get_items')
+    get_resource_service('agenda').enhance_items(docs)
+    assert 1 == get_items.call_count
+    assert 'Amazon Is Opening More Bookstores' == docs[0]['coverages'][0]['item_headline']
+    assert 'Weather' == docs[1]['coverages'][0]['item_headline']
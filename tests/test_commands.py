@@ -1,6 +1,9 @@
 from flask import json
 from time import sleep
-from newsroom.mongo_utils import index_elastic_from_mongo
+from newsroom import elastic_utils
+from newsroom.elastic_utils import rebuild_elastic_index
+from newsroom.mongo_utils import index_elastic_from_mongo, create_checkpoint, get_checkpoint, \
+    get_checkpoints_collection
 
 from .fixtures import items, init_items, init_auth, init_company  # noqa
 
@@ -69,3 +72,75 @@ def test_index_from_mongo_collection(app, client):
     assert resp.status_code == 200
     data = json.loads(resp.get_data())
     assert 3 == len(data['_items'])
+
+
+def test_index_from_mongo_resume(app, client):
+    remove_elastic_index(app)
+    app.data.init_elastic(app)
+    sleep(1)
+    create_checkpoint('items')
+    get_checkpoints_collection().update_one({'_id': 'items'}, {'$set': {'shards.0.last_id': 'tag:weather:old'}})
+    index_elastic_from_mongo(collection='items', resume=True)
+    sleep(1)
+
+    resp = client.get('/wire/urn:localhost:flood')
+    assert resp.status_code == 200
+
+    resp = client.get('/wire/tag:foo')
+    assert resp.status_code == 404
+    assert get_checkpoint('items') is None
+
+
+def test_index_from_mongo_resume_with_hours(app, client):
+    remove_elastic_index(app)
+    app.data.init_elastic(app)
+    sleep(1)
+    create_checkpoint('items', hours=24)
+    checkpoint = get_checkpoints_collection().find_one({'_id': 'items'})
+    assert checkpoint['since']
+    assert 'query' not in checkpoint
+    index_elastic_from_mongo(collection='items', resume=True)
+    sleep(1)
+
+    resp = client.get('/wire/tag:foo')
+    assert resp.status_code == 200
+
+    resp = client.get('/wire/search')
+    data = json.loads(resp.get_data())
+    assert 1 == len(data['_items'])
+    assert get_checkpoint('items') is None
+
+
+def test_elastic_rebuild_switches_alias(app, client):
+    index_name = app.config['CONTENTAPI_ELASTICSEARCH_INDEX']
+    old_index = app.data.elastic.get_index_by_alias(index_name)
+
+    rebuild_elastic_index(workers=2)
+    sleep(1)
+
+    assert app.data.elastic.get_index_by_alias(index_name) != old_index
+    resp = client.get('/wire/search')
+    data = json.loads(resp.get_data())
+    assert 3 == len(data['_items'])
+
+
+def test_elastic_rebuild_removes_deleted_documents(app, client, mocker):
+    index_name = app.config['CONTENTAPI_ELASTICSEARCH_INDEX']
+    old_index = app.data.elastic.get_index_by_alias(index_name)
+    es = app.data.elastic.es
+    copy_index = elastic_utils.copy_index
+
+    def copy_and_delete(*args, **kwargs):
+        count = copy_index(*args, **kwargs)
+        if not kwargs.get('since'):  # item deleted after the full copy
+            es.delete(index=old_index, doc_type='items', id='tag:foo', refresh=True)
+            es.indices.refresh(index=args[2])
+        return count
+
+    mocker.patch('newsroom.elastic_utils.copy_index', side_effect=copy_and_delete)
+    rebuild_elastic_index(workers=2)
+    sleep(1)
+
+    data = json.loads(client.get('/wire/search').get_data())
+    assert 2 == len(data['_items'])
+    assert 'tag:foo' not in [item['_id'] for item in data['_items']]
@@ -115,3 +115,15 @@ def test_save_company_permissions(client, app):
     # test section protection
     resp = client.get(url_for('agenda.index'))
     assert resp.status_code == 403
+
+
+def test_company_products_change_syncs_percolator(client, app, mocker):
+    app.config['WIRE_NOTIFICATIONS_PERCOLATOR'] = True
+    app.data.insert('companies', [{'_id': 'c-1', 'name': 'Press Co.', 'is_enabled': True}])
+    app.data.insert('products', [{'_id': 'p-1', 'name': 'Sport', 'companies': ['c-1'], 'is_enabled': True}])
+    sync = mocker.patch('newsroom.topics.percolator.sync_topics_task.delay')
+
+    test_login_succeeds_for_admin(client)
+    data = json.dumps({'products': {}, 'sections': {'wire': True}})
+    client.post('companies/c-1/permissions', data=data, content_type='application/json')
+    assert sync.called
@@ -3,10 +3,15 @@ import json
 import lxml
 import zipfile
 import icalendar
+import multiprocessing
 
 from datetime import timedelta
 from superdesk.utc import utcnow
 
+from newsroom.history import insert_history
+from newsroom.wire import download
+from newsroom.wire.download import stream_zip, get_download_items
+
 from .fixtures import items, init_items, init_auth, agenda_items, init_agenda_items  # noqa
 
 items_ids = [item['_id'] for item in items[:2]]
@@ -152,3 +157,88 @@ def test_agenda_download(client, app):
     assert history[0].get('created') + timedelta(seconds=2) >= utcnow()
     assert history[0].get('item') == agenda_items[0]['_id']
     assert history[0].get('company') is None
+
+
+def test_download_fails_if_item_is_missing(client, app):
+    resp = client.get('/download/%s,missing?format=text&type=wire' % items_ids[0])
+    assert resp.status_code == 404
+    assert 0 == app.data.find('history', None, None).count()
+
+
+def test_stream_zip():
+    chunks = list(stream_zip(('file-%d.txt' % i, b'content %d' % i) for i in range(3)))
+    assert all(chunks[:3])
+    with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as zf:
+        assert ['file-0.txt', 'file-1.txt', 'file-2.txt'] == zf.namelist()
+        assert b'content 2' == zf.read('file-2.txt')
+
+
+def test_wire_download_formats_in_worker_processes(client, app):
+    app.config['DOWNLOAD_FORMAT_PROCESSES'] = 2
+    app.config['DOWNLOAD_FORMAT_PROCESSES_MIN_ITEMS'] = 1
+    _file = download_zip_file(client, 'text', 'wire')
+    with zipfile.ZipFile(_file) as zf:
+        assert len(items_ids) == len(zf.namelist())
+        text_content_test(zf.read(filename('amazon-bookstore-opening.txt', item)))
+    assert download.get_format_pool(2) is download.get_format_pool(2)
+
+
+def test_wire_download_replaces_stuck_worker_pool(client, app, mocker):
+    app.config['DOWNLOAD_FORMAT_PROCESSES'] = 2
+    app.config['DOWNLOAD_FORMAT_PROCESSES_MIN_ITEMS'] = 1
+    result = mocker.Mock(spec=multiprocessing.pool.AsyncResult)
+    result.get.side_effect = multiprocessing.TimeoutError()
+    pool = mocker.Mock()
+    pool.apply_async.return_value = result
+    mocker.patch('newsroom.wire.download.get_format_pool', return_value=pool)
+    reset = mocker.patch('newsroom.wire.download.reset_format_pool')
+    _file = download_zip_file(client, 'text', 'wire')
+    with zipfile.ZipFile(_file) as zf:
+        assert len(items_ids) == len(zf.namelist())
+        text_content_test(zf.read(filename('amazon-bookstore-opening.txt', item)))
+    reset.assert_called_once_with(pool)
+    assert 1 == result.get.call_count
+
+
+def test_download_uses_formatted_items_cache(client, app, mocker):
+    formatter = app.download_formatters['text']['formatter']
+    format_item = mocker.spy(formatter, 'format_item')
+    for i in range(2):
+        resp = client.get('/download/%s?format=text' % item['_id'])
+        assert resp.status_code == 200
+        text_content_test(resp.get_data())
+    assert 1 == format_item.call_count
+
+    app.data.get_mongo_collection('items').update_one({'_id': item['_id']}, {'$set': {'version': '2'}})
+    resp = client.get('/download/%s?format=text' % item['_id'])
+    assert resp.status_code == 200
+    assert 2 == format_item.call_count
+
+
+def test_download_history_async(client, app, mocker):
+    app.config['HISTORY_ASYNC'] = True
+    delay = mocker.patch('newsroom.history.insert_history.delay')
+    download_zip_file(client, 'text', 'wire')
+    assert 1 == delay.call_count
+    docs = delay.call_args[0][0]
+    assert sorted(items_ids) == sorted(doc['item'] for doc in docs)
+    assert 0 == app.data.find('history', None, None).count()
+
+    insert_history.apply(args=(docs, ))
+    assert len(items_ids) == app.data.find('history', None, None).count()
+
+
+def test_insert_history_ignores_duplicates(client, app, mocker):
+    download_zip_file(client, 'text', 'wire')
+    docs = list(app.data.get_mongo_collection('history').find())
+    insert_many = mocker.spy(app.data.get_mongo_collection('history').__class__, 'insert_many')
+    insert_history.delay(docs)
+    assert 1 == insert_many.call_count
+    assert len(items_ids) == app.data.find('history', None, None).count()
+
+
+def test_download_items_keep_requested_order(client, app, mocker):
+    mocker.patch('newsroom.wire.download.DOWNLOAD_BATCH_SIZE', 2)
+    ids = [item['_id'] for item in reversed(items)]
+    with app.test_request_context():
+        assert ids == [item['_id'] for item in get_download_items(ids + ['missing'], 'items')]
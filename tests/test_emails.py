@@ -1,5 +1,6 @@
-from newsroom.email import send_new_item_notification_email
-from flask import render_template_string, json, url_for
+from flask_mail import Message
+from newsroom.email import send_new_item_notification_email, send_email, pooled_emails, send_emails
+from flask import render_template, render_template_string, json, url_for
 
 
 def test_item_notification_template(client, app, mocker):
@@ -58,3 +59,54 @@ Link: {{ item_url }}
 
 {% endblock %}
 """, app_name=app.config['SITE_NAME'], item_url=item_url))
+
+
+def test_pooled_emails_use_single_connection(client, app, mocker):
+    app.config['MAIL_BATCH_SIZE'] = 2
+    connect = mocker.spy(app.mail, 'connect')
+
+    with app.mail.record_messages() as outbox:
+        with app.test_request_context():
+            with pooled_emails():
+                for i in range(5):
+                    send_email(to=['foo{}@example.com'.format(i)], subject='Foo', text_body='Bar')
+                assert len(outbox) == 0
+
+    assert len(outbox) == 5
+    assert connect.call_count == 3
+
+
+def test_send_emails_reports_failed_batches(client, app, mocker):
+    app.config['MAIL_BATCH_SIZE'] = 2
+    app.config['MAIL_SEND_CONCURRENCY'] = 2
+    mocker.patch.object(app.mail, 'connect', side_effect=ConnectionRefusedError)
+    error = mocker.patch('newsroom.email.logger.error')
+
+    with app.test_request_context():
+        messages = [Message(recipients=['foo{}@example.com'.format(i)], subject='Foo', body='Bar') for i in range(3)]
+        assert 3 == send_emails(messages)
+    error.assert_called_with('Failed to send %d of %d emails', 3, 3)
+
+
+def test_item_notification_template_rendered_once(client, app, mocker):
+    item = {
+        '_id': 'tag:localhost:2018:rendered-once',
+        'guid': 'tag:localhost:2018:rendered-once',
+        'version': '2',
+        'headline': 'Headline',
+        'body_html': '<p>HTML Body</p>',
+        'type': 'text',
+    }
+
+    render = mocker.patch('newsroom.email.render_template', wraps=render_template)
+    sub = mocker.patch('newsroom.email.send_email')
+
+    with app.test_request_context():
+        send_new_item_notification_email({'email': 'foo@example.com', 'first_name': 'Foo'}, 'Topic', item)
+        send_new_item_notification_email({'email': 'bar@example.com', 'first_name': 'Bar'}, 'Other', item)
+
+    assert render.call_count == 2
+    assert sub.call_count == 2
+    assert sub.call_args[1]['subject'] == 'New story for followed topic: Other'
+    assert '__newsroom_email_' not in sub.call_args[1]['text_body']
+    assert '<p>HTML Body</p>' in sub.call_args[1]['html_body']
@@ -4,6 +4,8 @@ import datetime
 from superdesk.utc import utcnow
 from superdesk import get_resource_service
 from newsroom.notifications import get_user_notifications
+from newsroom.notifications.dispatcher import NotificationDispatcher
+from newsroom.notifications.notifications import get_notifications_summary
 
 user = str(ObjectId())
 
@@ -98,3 +100,56 @@ def test_delete_all_notifications(client):
     resp = client.get(notifications_url)
     data = json.loads(resp.get_data())
     assert 0 == len(data['_items'])
+
+
+def test_create_notifications_in_bulk(client, app):
+    other_user = str(ObjectId())
+    ids = get_resource_service('notifications').create([
+        notification,
+        notification,
+        {'item': 'Foo', 'user': other_user},
+    ])
+
+    assert ids == ['{}_Foo'.format(user), '{}_Foo'.format(other_user)]
+    assert 1 == len(get_user_notifications(ObjectId(user)))
+    assert 1 == len(get_user_notifications(ObjectId(other_user)))
+
+
+def test_notifications_summary_is_invalidated_on_change(client, app, mocker):
+    app.config['NOTIFICATIONS_TTL'] = 1
+    item = {'_id': 'Foo', 'type': 'text', 'headline': 'Foo', 'versioncreated': utcnow(), 'body_html': 'foo'}
+    get_items = mocker.patch.object(get_resource_service('wire_search'), 'get_items', return_value=[])
+    assert [] == get_notifications_summary(user)
+    assert [] == get_notifications_summary(user)
+    assert 1 == get_items.call_count
+
+    get_resource_service('notifications').create([notification])
+    get_items.return_value = [item]
+    summary = get_notifications_summary(user)
+    assert 2 == get_items.call_count
+    assert 1 == len(summary)
+    assert 'Foo' == summary[0]['headline']
+    assert 'body_html' not in summary[0]
+
+    resp = client.delete('/users/{}/notifications/{}_Foo'.format(user, user))
+    assert 200 == resp.status_code
+    get_items.return_value = []
+    assert [] == get_notifications_summary(user)
+    assert 3 == get_items.call_count
+
+
+def test_dispatcher_sends_single_email_per_notification_type(client, app, mocker):
+    topic_email = mocker.Mock()
+    killed_email = mocker.Mock()
+    user_doc = {'_id': ObjectId(user)}
+
+    with app.test_request_context():
+        with NotificationDispatcher('Foo') as dispatcher:
+            dispatcher.add_users([user, user])
+            assert dispatcher.add_email(user_doc, topic_email, user_doc)
+            assert not dispatcher.add_email(user_doc, topic_email, user_doc)
+            assert dispatcher.add_email(user_doc, killed_email, user_doc)
+
+    assert 1 == topic_email.call_count
+    assert 1 == killed_email.call_count
+    assert 1 == len(get_user_notifications(ObjectId(user)))
@@ -1,6 +1,9 @@
 from bson import ObjectId
 from flask import json
 from pytest import fixture
+from superdesk import get_resource_service
+
+from newsroom.wire.search import get_product_query
 
 from .test_users import test_login_succeeds_for_admin, init as user_init
 
@@ -95,3 +98,24 @@ def test_gets_all_products(client, app):
     resp = client.get('/products')
     data = json.loads(resp.get_data())
     assert 251 == len(data)
+
+
+def test_product_query_is_cached_until_products_change(client, app):
+    company = {'_id': ObjectId(), 'name': 'Press co.', 'is_enabled': True}
+    app.data.insert('companies', [company])
+    app.data.insert('products', [{
+        'name': 'Wire',
+        'query': 'sport',
+        'is_enabled': True,
+        'companies': [str(company['_id'])],
+        'product_type': 'wire',
+    }])
+
+    with app.test_request_context():
+        product_query = get_product_query(company, 'wire')
+        assert product_query is get_product_query(company, 'wire')
+        assert product_query.should[0]['query_string']['query'] == 'sport'
+
+        product = app.data.find_one('products', req=None, name='Wire')
+        get_resource_service('products').patch(product['_id'], {'query': 'news'})
+        assert get_product_query(company, 'wire').should[0]['query_string']['query'] == 'news'
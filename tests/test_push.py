@@ -5,9 +5,12 @@ import hmac
 import bson
 from bson import ObjectId
 from flask import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from superdesk import get_resource_service
+from superdesk.utc import utcnow
 from newsroom.utils import get_entity_or_404
+from newsroom import media_utils
+from newsroom.media_utils import generate_item_renditions
 from .fixtures import init_auth
 
 
@@ -157,6 +160,119 @@ def test_push_featuremedia_generates_renditions(client):
         assert 200 == resp.status_code
 
 
+def test_push_featuremedia_generates_renditions_async(client, app, mocker):
+    app.config['RENDITIONS_ASYNC'] = True
+    delay = mocker.patch('newsroom.push.generate_item_renditions.delay')
+    media_id = str(bson.ObjectId())
+    upload_binary('picture.jpg', client, media_id=media_id)
+    item = {
+        'guid': 'test',
+        'type': 'text',
+        'associations': {
+            'featuremedia': {
+                'type': 'picture',
+                'mimetype': 'image/jpeg',
+                'renditions': {
+                    '4-3': {
+                        'media': media_id,
+                    },
+                    'viewImage': {
+                        'media': media_id,
+                    }
+                }
+            }
+        }
+    }
+
+    resp = client.post('/push', data=json.dumps(item), content_type='application/json')
+    assert 200 == resp.status_code
+    delay.assert_called_once_with('test')
+
+    picture = get_entity_or_404('test', 'items')['associations']['featuremedia']
+    placeholder = picture['renditions']['_newsroom_thumbnail']
+    assert 404 == client.get(placeholder['href']).status_code
+    assert 'width' not in placeholder
+
+    generate_item_renditions('test')
+
+    picture = get_entity_or_404('test', 'items')['associations']['featuremedia']
+    for name in ['thumbnail', 'thumbnail_large', 'view']:
+        rendition = picture['renditions']['_newsroom_%s' % name]
+        assert rendition['width']
+        resp = client.get(rendition['href'])
+        assert 200 == resp.status_code
+    assert placeholder['href'] == picture['renditions']['_newsroom_thumbnail']['href']
+
+
+def test_push_featuremedia_decodes_picture_once(client, mocker):
+    media_utils._watermarks.clear()
+    open_image = mocker.spy(media_utils.Image, 'open')
+    media_id = str(bson.ObjectId())
+    upload_binary('picture.jpg', client, media_id=media_id)
+    item = {
+        'guid': 'test',
+        'type': 'text',
+        'associations': {
+            'featuremedia': {
+                'type': 'picture',
+                'mimetype': 'image/jpeg',
+                'renditions': {
+                    '4-3': {
+                        'media': media_id,
+                    },
+                    'baseImage': {
+                        'media': media_id,
+                    },
+                    'viewImage': {
+                        'media': media_id,
+                    }
+                }
+            }
+        }
+    }
+
+    resp = client.post('/push', data=json.dumps(item), content_type='application/json')
+    assert 200 == resp.status_code
+    assert 3 == open_image.call_count  # thumbnail, picture and watermark
+
+    item['guid'] = 'test2'
+    resp = client.post('/push', data=json.dumps(item), content_type='application/json')
+    assert 200 == resp.status_code
+    assert 5 == open_image.call_count  # watermark is cached
+
+
+def test_push_featuremedia_custom_preview_renditions(client, app, mocker):
+    generate_preview = mocker.Mock()
+    app.generate_preview_details_renditions = lambda picture: generate_preview(picture)
+    draft = mocker.spy(media_utils.Image.Image, 'draft')
+    media_id = str(bson.ObjectId())
+    upload_binary('picture.jpg', client, media_id=media_id)
+    item = {
+        'guid': 'test',
+        'type': 'text',
+        'associations': {
+            'featuremedia': {
+                'type': 'picture',
+                'mimetype': 'image/jpeg',
+                'renditions': {
+                    '4-3': {
+                        'media': media_id,
+                    },
+                }
+            }
+        }
+    }
+
+    resp = client.post('/push', data=json.dumps(item), content_type='application/json')
+    assert 200 == resp.status_code
+    assert 1 == generate_preview.call_count
+    picture = get_entity_or_404('test', 'items')['associations']['featuremedia']
+    assert picture['renditions']['_newsroom_thumbnail']['width'] <= media_utils.THUMBNAIL_SIZE[0]
+    assert picture['renditions']['_newsroom_thumbnail']['height'] <= media_utils.THUMBNAIL_SIZE[1]
+    if picture['renditions']['_newsroom_thumbnail_large']['width'] > media_utils.THUMBNAIL_SIZE[0]:
+        assert 1 == draft.call_count
+
+
 def test_push_featuremedia_has_renditions_for_existing_media(client):
     media_id = str(bson.ObjectId())
     upload_binary('picture.jpg', client, media_id=media_id)
@@ -586,3 +702,111 @@ def test_push_event_coverage_info(client, app):
     parsed = get_entity_or_404(item['guid'], 'items')
     assert parsed['event_id'] == 'urn:event/1'
     assert parsed['coverage_id'] == 'urn:coverage/1'
+
+
+def test_push_queue(client, app, mocker):
+    app.config['PUSH_QUEUE_ENABLED'] = True
+    delay = mocker.patch('newsroom.push.process_push_queue.delay')
+    data = json.dumps({'guid': 'foo', 'type': 'text', 'headline': 'Foo'})
+    resp = client.post('/push', data=data, content_type='application/json')
+    assert 202 == resp.status_code
+    assert delay.called
+
+    queue_id = delay.call_args[0][0]
+    from newsroom.push import get_push_queue_collection, process_push_queue
+    assert get_push_queue_collection().find_one({'_id': queue_id})['guid'] == 'foo'
+
+    process_push_queue(queue_id)
+    assert get_push_queue_collection().find_one({'_id': queue_id}) is None
+    assert get_entity_or_404('foo', 'items')['headline'] == 'Foo'
+
+
+def test_push_queue_keeps_order_after_failure(client, app, mocker):
+    from newsroom.push import get_push_queue_collection, process_push_queue, enqueue_push
+    collection = get_push_queue_collection()
+    item = {'guid': 'foo', 'type': 'text'}
+    failed_id = enqueue_push(item, 'invalid json')
+    queue_id = enqueue_push(item, json.dumps({'guid': 'foo', 'type': 'text', 'headline': 'Foo'}))
+
+    process_push_queue(queue_id)
+    assert 'failed' == collection.find_one({'_id': failed_id})['status']
+    assert 'pending' == collection.find_one({'_id': queue_id})['status']
+
+    # processing entry left by crashed worker is processed again after lease timeout
+    collection.update_one({'_id': failed_id}, {'$set': {
+        'status': 'processing',
+        'started': utcnow() - timedelta(seconds=app.config['PUSH_QUEUE_LEASE_TIMEOUT'] + 1),
+        'payload': json.dumps({'guid': 'foo', 'type': 'text', 'headline': 'Bar'}),
+    }})
+    process_push_queue(queue_id)
+    assert collection.find_one({'guid': 'foo'}) is None
+    assert get_entity_or_404('foo', 'items')['headline'] == 'Foo'
+
+
+def test_push_queue_waits_for_leased_entry(client, app, mocker):
+    from newsroom.push import get_push_queue_collection, process_push_queue, enqueue_push, requeue_pushes
+    collection = get_push_queue_collection()
+    item = {'guid': 'foo', 'type': 'text'}
+    leased_id = enqueue_push(item, json.dumps({'guid': 'foo', 'type': 'text', 'headline': 'Bar'}))
+    queue_id = enqueue_push(item, json.dumps({'guid': 'foo', 'type': 'text', 'headline': 'Foo'}))
+    collection.update_one({'_id': leased_id}, {'$set': {'status': 'processing', 'started': utcnow()}})
+
+    # entry is still processed by other worker, newer push must wait
+    process_push_queue(queue_id)
+    assert 'pending' == collection.find_one({'_id': queue_id})['status']
+
+    delay = mocker.patch('newsroom.push.process_push_queue.delay')
+    assert 0 == requeue_pushes('processing')
+    assert not delay.called
+    assert 'processing' == collection.find_one({'_id': leased_id})['status']
+
+
+def test_push_unknown_type(client, app):
+    resp = client.post('/push', data=json.dumps({'guid': 'foo', 'type': 'foo'}), content_type='application/json')
+    assert 400 == resp.status_code
+
+
+def test_notify_topic_matches_using_percolator(client, app, mocker):
+    app.config['WIRE_NOTIFICATIONS_PERCOLATOR'] = True
+    user_ids = app.data.insert('users', [{
+        'email': 'foo@bar.com',
+        'first_name': 'Foo',
+        'is_enabled': True,
+        'receive_email': True,
+        'user_type': 'administrator'
+    }])
+
+    with client as cli:
+        with client.session_transaction() as session:
+            user = str(user_ids[0])
+            session['user'] = user
+
+        resp = cli.post('api/users/%s/topics' % user,
+                        data={'label': 'bar', 'query': 'test', 'notifications': True, 'topic_type': 'wire'})
+        assert 201 == resp.status_code
+        resp = cli.post('api/users/%s/topics' % user,
+                        data={'label': 'baz', 'query': 'other', 'notifications': True, 'topic_type': 'wire'})
+        assert 201 == resp.status_code
+
+    push_mock = mocker.patch('newsroom.push.push_notification')
+    data = json.dumps({'guid': 'foo', 'type': 'text', 'headline': 'this is a test'})
+    resp = client.post('/push', data=data, content_type='application/json')
+    assert 200 == resp.status_code
+    assert push_mock.call_args[1]['item']['_id'] == 'foo'
+    assert len(push_mock.call_args[1]['topics']) == 1
+
+
+def test_percolator_topics_are_synced_on_products_change(client, app, mocker):
+    app.config['WIRE_NOTIFICATIONS_PERCOLATOR'] = True
+    sync = mocker.patch('newsroom.topics.percolator.sync_topics_task.delay')
+    ids = get_resource_service('products').post([{'name': 'Sport', 'query': 'sport'}])
+    assert sync.called
+
+    sync.reset_mock()
+    get_resource_service('products').patch(ids[0], {'query': 'football'})
+    assert sync.called
+
+    sync.reset_mock()
+    user_id = app.data.insert('users', [{'email': 'foo@bar.com', 'is_enabled': True}])[0]
+    get_resource_service('users').patch(user_id, {'is_enabled': False})
+    sync.assert_called_with(str(user_id))
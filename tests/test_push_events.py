@@ -8,6 +8,7 @@ from copy import deepcopy
 
 from superdesk import get_resource_service
 from newsroom.utils import get_entity_or_404
+from newsroom.push import get_coverages, get_agenda_updates
 from newsroom.notifications import get_user_notifications
 from .fixtures import init_auth
 
@@ -752,6 +753,25 @@ New coverage received for agenda item {{ agenda.name }}:
     )
 
 
+def test_push_item_with_coverage_uses_mongo_lookup(client, app, mocker):
+    test_item = {
+        'type': 'text',
+        'guid': 'item',
+        'planning_id': test_planning['_id'],
+        'coverage_id': test_planning['coverages'][0]['coverage_id'],
+    }
+    post_json(client, '/push', test_event)
+    post_json(client, '/push', test_planning)
+
+    # agenda is not refreshed in elastic yet
+    mocker.patch.object(get_resource_service('agenda'), 'get_items_by_query', return_value=[])
+    post_json(client, '/push', test_item)
+
+    agenda = app.data.find_one('agenda', req=None, _id='foo')
+    assert agenda['coverages'][0]['delivery_id'] == test_item['guid']
+    assert app.data.find_one('wire_search', req=None, _id='item')['agenda_id'] == 'foo'
+
+
 def assign_active_company(app):
     company_ids = app.data.insert('companies', [{
         'name': 'Press co.',
@@ -1113,3 +1133,92 @@ def test_push_event_from_planning(client, app):
     assert '06002002' == parsed['subject'][0]['code']
     assert parsed['dates']['start'].isoformat() == event['dates']['start'].replace('0000', '00:00')
     assert parsed['dates']['end'].isoformat() == event['dates']['end'].replace('0000', '00:00')
+
+
+def test_push_planning_updates_only_changed_planning_items(client, app, mocker):
+    event = deepcopy(test_event)
+    event['guid'] = 'foo5'
+    client.post('/push', data=json.dumps(event), content_type='application/json')
+
+    plannings = []
+    for guid in ('bar1', 'bar2'):
+        planning = deepcopy(test_planning)
+        planning['guid'] = guid
+        planning['event_item'] = 'foo5'
+        for coverage in planning['coverages']:
+            coverage['coverage_id'] = '{}-{}'.format(guid, coverage['coverage_id'])
+        client.post('/push', data=json.dumps(planning), content_type='application/json')
+        plannings.append(planning)
+
+    original = get_entity_or_404('foo5', 'agenda')
+    results = []
+
+    def get_updates(agenda, original):
+        results.append(get_agenda_updates(agenda, original))
+        return results[-1]
+
+    mocker.patch('newsroom.push.get_agenda_updates', side_effect=get_updates)
+    plannings[1]['headline'] = 'Updated headline'
+    client.post('/push', data=json.dumps(plannings[1]), content_type='application/json')
+
+    updates, operations = results[-1]
+    assert 2 == len(operations)
+    assert 'planning_items' not in operations[0]._doc['$set']
+    assert 'coverages' not in operations[0]._doc['$set']
+    assert 'event' not in updates
+    assert {'_id': 'foo5', 'planning_items.guid': 'bar2'} == operations[1]._filter
+    assert 'Updated headline' == operations[1]._doc['$set']['planning_items.$']['headline']
+
+    parsed = get_entity_or_404('foo5', 'agenda')
+    assert 2 == len(parsed['planning_items'])
+    assert 'Updated headline' == parsed['planning_items'][1]['headline']
+    assert original['planning_items'][0] == parsed['planning_items'][0]
+    assert 4 == len(parsed['coverages'])
+    assert original['_etag'] != parsed['_etag']
+
+    indexed = app.data._search_backend('agenda').find_one('agenda', req=None, _id='foo5')
+    assert 'Updated headline' == indexed['planning_items'][1]['headline']
+    assert parsed['_etag'] == indexed['_etag']
+
+    client.post('/push', data=json.dumps(plannings[1]), content_type='application/json')
+    assert ({}, []) == results[-1]
+
+
+def test_get_agenda_updates_sets_list_when_entries_added(app):
+    original = {
+        '_id': 'foo',
+        '_etag': 'etag',
+        'name': 'foo',
+        'planning_items': [{'guid': 'bar1'}],
+        'coverages': [{'coverage_id': 'cov1', 'slugline': 'cov1'}],
+    }
+    agenda = deepcopy(original)
+    agenda['planning_items'].append({'guid': 'bar2'})
+    agenda['coverages'][0]['slugline'] = 'updated'
+
+    updates, operations = get_agenda_updates(agenda, original)
+    assert 'name' not in updates
+    assert 'etag' != updates['_etag']
+    assert [{'guid': 'bar1'}, {'guid': 'bar2'}] == operations[0]._doc['$set']['planning_items']
+    assert 'coverages' not in operations[0]._doc['$set']
+    assert {'_id': 'foo', 'coverages.coverage_id': 'cov1'} == operations[1]._filter
+    assert 'updated' == operations[1]._doc['$set']['coverages.$']['slugline']
+    assert 2 == len(operations)
+
+    assert ({}, []) == get_agenda_updates(original, deepcopy(original))
+
+
+def test_get_coverages_rebuilds_planning_with_replaced_coverage(app):
+    planning_items = [{
+        'guid': 'bar1',
+        'coverages': [{
+            'coverage_id': 'new',
+            'workflow_status': 'draft',
+            'planning': {'scheduled': datetime(2018, 5, 28, 10), 'g2_content_type': 'picture', 'slugline': 'new'},
+        }],
+    }, {'guid': 'bar2', 'coverages': []}]
+    original = [{'coverage_id': 'old', 'planning_id': 'bar1'}]
+
+    coverages, changes = get_coverages(planning_items, original, planning_id='bar2')
+    assert ['new'] == [c['coverage_id'] for c in coverages]
+    assert changes.get('coverage_added')
@@ -1,10 +1,10 @@
 from bson import ObjectId
 from flask import json
-from flask import url_for
+from flask import url_for, session
 from pytest import fixture
 from superdesk import get_resource_service
 
-from newsroom.auth import get_user_by_email
+from newsroom.auth import get_user, get_user_by_email
 
 
 @fixture(autouse=True)
@@ -259,3 +259,37 @@ def test_return_search_for_all_users(client, app):
     resp = client.get('/users/search?q=fo')
     data = json.loads(resp.get_data())
     assert 250 == len(data)
+
+
+def test_get_user_is_cached_until_updated(client, app, mocker):
+    user = get_user_by_email('admin@sourcefabric.org')
+    service = get_resource_service('users')
+    find_one = mocker.spy(service, 'find_one')
+
+    with app.test_request_context():
+        session['user'] = str(user['_id'])
+        assert get_user()['first_name'] == 'admin'
+        assert get_user()['first_name'] == 'admin'
+        assert find_one.call_count == 1
+
+        service.patch(user['_id'], {'first_name': 'updated'})
+        assert get_user()['first_name'] == 'updated'
+
+
+def test_get_user_cache_is_per_user(client, app, mocker):
+    user = get_user_by_email('admin@sourcefabric.org')
+    other_id = ObjectId()
+    app.data.insert('users', [{'_id': other_id, 'email': 'other@bar.com', 'first_name': 'other'}])
+    service = get_resource_service('users')
+
+    with app.test_request_context():
+        session['user'] = str(user['_id'])
+        get_user()['first_name'] = 'changed'
+        assert get_user()['first_name'] == 'admin'
+
+    with app.test_request_context():
+        find_one = mocker.spy(service, 'find_one')
+        service.system_update(other_id, {'locale': 'fr_CA'}, service.find_one(req=None, _id=other_id))
+        session['user'] = str(user['_id'])
+        assert get_user()['first_name'] == 'admin'
+        assert find_one.call_count == 1  # only the other user lookup
@@ -1,7 +1,11 @@
-from flask import json, g
+from flask import json, g, session
 from bson import ObjectId
 from datetime import datetime, timedelta
 from urllib import parse
+from superdesk import get_resource_service
+import newsroom
+from newsroom.pagination import get_cursor_query, get_next_cursor
+from newsroom.wire.dashboard import get_items_by_card, get_card_cache_key, invalidate_cards
 
 from .fixtures import items, init_items, init_auth, init_company, PUBLIC_USER_ID  # noqa
 from .utils import get_json
@@ -83,6 +87,27 @@ def test_bookmarks(client, app):
     assert 0 == get_bookmarks_count(client, user_id)
 
 
+def test_bookmark_multiple_items(client, app):
+    user_id = app.data.find_all('users')[0]['_id']
+    item_ids = [items[0]['_id'], items[1]['_id'], items[2]['_id']]
+
+    resp = client.post('/wire_bookmark', data=json.dumps({
+        'items': item_ids,
+    }), content_type='application/json')
+    assert resp.status_code == 200
+    assert 3 == get_bookmarks_count(client, user_id)
+
+    for _id in item_ids:
+        item = app.data.find_one('items', req=None, _id=_id)
+        assert [str(user_id)] == [str(bookmark) for bookmark in item['bookmarks']]
+
+    resp = client.delete('/wire_bookmark', data=json.dumps({
+        'items': item_ids[:2],
+    }), content_type='application/json')
+    assert resp.status_code == 200
+    assert 1 == get_bookmarks_count(client, user_id)
+
+
 def test_bookmarks_by_section(client, app):
     products = [
         {
@@ -341,6 +366,48 @@ def test_search_pagination(client):
     assert 400 == resp.status_code
 
 
+def test_search_cursor_pagination(client, app):
+    data = get_json(client, '/wire/search')
+    assert data['_next']
+    data = get_json(client, '/wire/search?after={}'.format(data['_next']))
+    assert 0 == len(data['_items'])
+    assert '_aggregations' not in data
+
+    resp = client.get('/wire/search?after=foo')
+    assert 400 == resp.status_code
+
+    items = list(app.data.find_all('items'))
+    backend = app.data._search_backend('items')
+    seen = []
+    token = None
+    for _ in items:  # page by single item, some items have same versioncreated
+        query = {'bool': {'must': [{'terms': {'_id': [item['_id'] for item in items]}}]}}
+        if token:
+            query['bool']['must'].append(get_cursor_query(token, 'versioncreated', 'desc'))
+        hits = backend.elastic('items').search(body={'query': query, 'sort': [{'versioncreated': 'desc'}], 'size': 1},
+                                               **backend._es_args('items'))
+        page = list(backend._parse_hits(hits, 'items'))
+        assert 1 == len(page)
+        assert page[0]['_id'] not in seen
+        seen.append(page[0]['_id'])
+        token = get_next_cursor(page, 'versioncreated', token)
+    assert len(items) == len(seen)
+
+
+def test_search_uses_cached_aggregations(client, app, mocker):
+    app.config['AGGREGATIONS_CACHE_TIMEOUT'] = 60
+    search = mocker.spy(newsroom.Service, 'get')
+    data = get_json(client, '/wire/search')
+    assert 'aggs' in json.loads(search.call_args[0][1].args['source'])
+
+    cached = get_json(client, '/wire/search')
+    assert 'aggs' not in json.loads(search.call_args[0][1].args['source'])
+    assert data['_aggregations'] == cached['_aggregations']
+
+    get_json(client, '/wire/search?q=weather')
+    assert 'aggs' in json.loads(search.call_args[0][1].args['source'])
+
+
 def test_search_created_from(client):
     resp = client.get('/wire/search?created_from=now/d')
     data = json.loads(resp.get_data())
@@ -401,6 +468,24 @@ def test_item_detail_access(client, app):
     assert data['body_html']
 
 
+def test_has_permissions_many(client, app):
+    app.data.insert('products', [{
+        '_id': 10,
+        'name': 'matching product',
+        'companies': ['1'],
+        'is_enabled': True,
+        'product_type': 'wire',
+        'query': 'slugline:%s' % items[0]['slugline']
+    }])
+
+    with app.test_request_context():
+        session['user'] = PUBLIC_USER_ID
+        session['user_type'] = 'public'
+        service = get_resource_service('wire_search')
+        assert service.has_permissions_many([item['_id'] for item in items]) == {items[0]['_id']}
+        assert service.has_permissions_many([]) == set()
+
+
 def test_search_using_section_filter_for_public_user(client, app):
     app.data.insert('navigations', [{
         '_id': 51,
@@ -559,3 +644,130 @@ def test_company_type_filter(client, app):
     data = json.loads(resp.get_data())
     assert 1 == len(data['_items'])
     assert 'WEATHER' != data['_items'][0]['slugline']
+
+
+def test_home_card_is_refreshed_when_matching_item_is_pushed(client, app, mocker):
+    product_id = ObjectId()
+    app.data.insert('products', [{
+        '_id': product_id,
+        'name': 'Foo',
+        'query': 'headline:foo',
+        'is_enabled': True,
+        'product_type': 'wire',
+    }])
+    app.data.insert('cards', [{
+        'label': 'Foo',
+        'type': '6-text-only',
+        'dashboard': 'newsroom',
+        'config': {'product': str(product_id), 'size': 6},
+    }, {
+        'label': 'Bar',
+        'type': '4-text-only',
+        'dashboard': 'newsroom',
+        'config': {'product': str(product_id), 'size': 4},
+    }])
+    cards = list(app.data.find_all('cards'))
+    get_product_items = mocker.spy(get_resource_service('wire_search'), 'get_products_items')
+
+    get_items_by_card(cards)
+    get_items_by_card(cards)
+    assert 1 == get_product_items.call_count
+
+    resp = client.post('/push', data=json.dumps({'guid': 'bar', 'type': 'text', 'headline': 'bar'}),
+                       content_type='application/json')
+    assert 200 == resp.status_code
+    get_items_by_card(cards)
+    assert 1 == get_product_items.call_count
+
+    resp = client.post('/push', data=json.dumps({'guid': 'foo', 'type': 'text', 'headline': 'foo'}),
+                       content_type='application/json')
+    assert 200 == resp.status_code
+    items_by_card = get_items_by_card(cards)
+    assert 2 == get_product_items.call_count
+    assert 'foo' in [item['_id'] for item in items_by_card['Foo']]
+    assert 'foo' in [item['_id'] for item in items_by_card['Bar']]
+
+
+def test_home_card_is_loaded_once_when_not_cached(client, app, mocker):
+    product_id = ObjectId()
+    app.data.insert('products', [{
+        '_id': product_id,
+        'name': 'Foo',
+        'query': 'headline:amazon',
+        'is_enabled': True,
+        'product_type': 'wire',
+    }])
+    card = {
+        'label': 'Foo',
+        'type': '6-text-only',
+        'dashboard': 'newsroom',
+        'config': {'product': str(product_id), 'size': 6},
+    }
+    app.data.insert('cards', [card])
+    cards = list(app.data.find_all('cards'))
+    get_product_items = mocker.spy(get_resource_service('wire_search'), 'get_products_items')
+    get_matching_products = mocker.spy(get_resource_service('wire_search'), 'get_matching_products')
+    mocker.patch('newsroom.wire.dashboard.REFRESH_WAIT_TIMEOUT', 0.2)
+
+    # other request is loading the card, it's loaded after waiting
+    lock_key = '{}:refresh'.format(get_card_cache_key(cards[0]))
+    app.cache.add(lock_key, 1)
+    assert 'Foo' in get_items_by_card(cards)
+    assert 1 == get_product_items.call_count
+    app.cache.delete(lock_key)
+
+    invalidate_cards(items[0])
+    assert 1 == get_matching_products.call_count
+
+    # card is stale already, there is no need to search
+    invalidate_cards(items[0])
+    assert 1 == get_matching_products.call_count
+
+
+def login_public_user_with_product(client, app):
+    app.data.insert('products', [{
+        '_id': 10,
+        'name': 'matching product',
+        'companies': ['1'],
+        'is_enabled': True,
+        'product_type': 'wire',
+        'query': 'slugline:%s' % items[0]['slugline']
+    }])
+
+    with client.session_transaction() as session:
+        session['user'] = str(PUBLIC_USER_ID)
+        session['user_type'] = 'public'
+
+
+def test_download_checks_permissions(client, app):
+    login_public_user_with_product(client, app)
+
+    resp = client.get('/download/%s?format=text' % ','.join([item['_id'] for item in items[:2]]))
+    assert resp.status_code == 403
+
+    resp = client.get('/download/%s?format=text' % items[1]['_id'])
+    assert resp.status_code == 403
+    assert 0 == app.data.find('history', None, None).count()
+
+    resp = client.get('/download/%s?format=text' % items[0]['_id'])
+    assert resp.status_code == 200
+    assert 1 == app.data.find('history', None, None).count()
+
+
+def test_share_checks_permissions(client, app):
+    login_public_user_with_product(client, app)
+
+    with app.mail.record_messages() as outbox:
+        resp = client.post('/wire_share', data=json.dumps({
+            'items': [item['_id'] for item in items[:2]],
+            'users': [str(PUBLIC_USER_ID)],
+        }), content_type='application/json')
+        assert resp.status_code == 403
+        assert 0 == len(outbox)
+
+        resp = client.post('/wire_share', data=json.dumps({
+            'items': [items[0]['_id']],
+            'users': [str(PUBLIC_USER_ID)],
+        }), content_type='application/json')
+        assert resp.status_code == 201
+        assert 1 == len(outbox)